@@ -0,0 +1,283 @@
+"""多次实验的批量分析。
+
+遍历目录树，每个含有电机或光谱数据文件的文件夹视为一次实验，在进程池中并行计算：
+    拉制速度、直径统计量（均值、标准差、最小、最大）、直径频谱中最强的几个峰、
+    指定波长处拟合的损耗 (dB/m)
+结果汇总为一张表，保存为 Parquet（没有 pyarrow 时为 .pkl）。每次实验的结果另存为
+实验文件夹中的 batch_analysis.json，输入文件和参数不变时直接复用，再次运行只计算
+新增或改动过的实验。
+
+用法：
+    python _batch_analysis.py 根目录 [--wavelengths 1310 1550] [--workers 4]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from _camera_export import PHOTO_FOLDER, SEGMENT_SUFFIX
+from _data_store import SPECTRA_SUFFIX, find_data_files, load_spectra
+from _frame_store import STORE_SUFFIX
+from _motor_dataset import MotorDataset
+from _spectral import motor_spectrum
+from _tool_functions import get_intensity_by_wavelength, linear_curve_fit
+
+try:
+    import pyarrow  # Parquet 需要 pyarrow，是可选依赖
+except ImportError:
+    pyarrow = None
+
+RESULT_FILE = "batch_analysis.json"
+RESULT_VERSION = 2
+SUMMARY_FILE = "batch_summary.parquet"
+
+# 频谱峰的筛选：相邻的峰至少相隔 PEAK_MIN_DISTANCE 个频率格，突出度至少为最高峰的
+# PEAK_MIN_PROMINENCE 倍，主峰旁边的泄漏旁瓣不会被当作另外的振荡
+PEAK_MIN_DISTANCE = 5
+PEAK_MIN_PROMINENCE = 0.05
+
+
+# 本工具生成的目录（光谱转存、帧数组、视频片段），其中可能有成千上万个文件，遍历时跳过
+DERIVED_SUFFIXES = (SPECTRA_SUFFIX, STORE_SUFFIX, SEGMENT_SUFFIX)
+
+
+def _is_derived(dir_name) -> bool:
+    return dir_name == PHOTO_FOLDER or dir_name.endswith(DERIVED_SUFFIXES)
+
+
+def find_runs(root) -> list[str]:
+    """目录树中所有含有电机或光谱数据的文件夹（不进入导出结果的目录）"""
+    runs = []
+    for folder, dirs, _ in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not _is_derived(d))
+        if find_data_files(folder, "motor") or find_data_files(folder, "spectra"):
+            runs.append(folder)
+    return runs
+
+
+def _signature(file_path) -> list:
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _run_files(folder) -> dict:
+    files = {}
+    for kind in ("motor", "spectra"):
+        found = find_data_files(folder, kind)
+        if found:
+            files[kind] = os.path.join(folder, found[0])
+    return files
+
+
+def _fft_peaks(df_fft, n_peaks) -> dict:
+    """频谱中幅度最大的 n_peaks 个峰（不含主峰的泄漏旁瓣），不足时为 NaN"""
+    amplitude = df_fft["y_fft"].to_numpy()
+    peaks = np.empty(0, dtype=int)
+    if len(amplitude):
+        peaks, _ = signal.find_peaks(
+            amplitude,
+            distance=PEAK_MIN_DISTANCE,
+            prominence=PEAK_MIN_PROMINENCE * amplitude.max(),
+        )
+    peaks = peaks[np.argsort(amplitude[peaks])[::-1][:n_peaks]]
+    frequency = df_fft["x_fft"].to_numpy()
+    result = {}
+    for k in range(n_peaks):
+        found = k < len(peaks)
+        result[f"peak{k + 1}_hz"] = float(frequency[peaks[k]]) if found else np.nan
+        result[f"peak{k + 1}_amplitude"] = (
+            float(amplitude[peaks[k]]) if found else np.nan
+        )
+    return result
+
+
+def analyze_run(folder, wavelengths=(1550.0,), cut_off=1.0, n_peaks=3) -> dict:
+    """一次实验的分析结果（一行汇总表），缺少的数据对应的列为 NaN。
+
+    Args:
+        wavelengths: 拟合损耗的波长 (nm)
+        cut_off: 直径频谱的截断频率（Hz）
+        n_peaks: 记录的频谱峰数
+    """
+    files = _run_files(folder)
+    result = {
+        "motor_file": os.path.basename(files.get("motor", "")),
+        "spectra_file": os.path.basename(files.get("spectra", "")),
+    }
+    pull_speed = np.nan
+    if "motor" in files:
+        dataset = MotorDataset(files["motor"])
+        pull_speed = dataset.pull_speed
+        result["pull_speed"] = pull_speed
+        if "fiber diameter" in dataset.columns:
+            for name, value in dataset.stats("fiber diameter").items():
+                result[f"diameter_{name}"] = value
+            df_fft = motor_spectrum(files["motor"], "fiber diameter", cut_off=cut_off)
+            result.update(_fft_peaks(df_fft, n_peaks))
+    if "spectra" in files and len(wavelengths):
+        data = load_spectra(files["spectra"])
+        # 与汇总页面的“拟合损耗”相同：平滑后转为 dB，对长度 (mm) 线性拟合
+        loss = get_intensity_by_wavelength(data, list(wavelengths), True, True)
+        length = data["time_axis"].to_numpy() * pull_speed
+        for k, wavelength in enumerate(wavelengths):
+            valid = np.isfinite(length) & np.isfinite(loss[:, k])
+            slope = np.nan
+            if valid.sum() >= 2:
+                slope, _ = linear_curve_fit(length[valid], loss[valid, k])
+            result[f"loss_{wavelength:g}nm_db_per_m"] = float(slope) * 1000
+    return result
+
+
+def analyze_run_cached(folder, **params) -> dict:
+    """analyze_run，结果保存在实验文件夹中；输入文件和参数不变时直接读取"""
+    files = _run_files(folder)
+    inputs = {kind: _signature(path) for kind, path in files.items()}
+    params = {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in params.items()
+    }
+    result_path = os.path.join(folder, RESULT_FILE)
+    try:
+        with open(result_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        if (
+            saved.get("version") == RESULT_VERSION
+            and saved.get("inputs") == inputs
+            and saved.get("params") == params
+        ):
+            return {**saved["result"], "cached": True}
+    except (OSError, ValueError):
+        pass
+
+    result = analyze_run(folder, **params)
+    saved = {
+        "version": RESULT_VERSION,
+        "params": params,
+        "inputs": inputs,
+        "result": result,
+    }
+    try:
+        tmp_path = result_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, result_path)
+    except OSError as e:
+        print(f"保存 {result_path} 出错：{e}")
+    return {**result, "cached": False}
+
+
+def run_batch(
+    root,
+    output_path=None,
+    wavelengths=(1550.0,),
+    cut_off=1.0,
+    n_peaks=3,
+    max_workers=None,
+    progress=None,
+) -> pd.DataFrame:
+    """并行分析 root 下的所有实验，保存并返回汇总表（每次实验一行，按文件夹排序）。
+
+    Args:
+        output_path: 汇总表路径，默认 root/batch_summary.parquet
+        max_workers: 进程数，默认 CPU 核数
+        progress: 回调 progress(done, total, unit)
+    """
+    runs = find_runs(root)
+    params = {"wavelengths": tuple(wavelengths), "cut_off": cut_off, "n_peaks": n_peaks}
+    rows = []
+    # 页面在多线程的 Streamlit 进程中调用，与 _jobs 一样用 spawn 启动子进程
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        futures = {
+            pool.submit(analyze_run_cached, folder, **params): folder for folder in runs
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            folder = futures[future]
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"分析 {folder} 出错：{e}")
+                row = {"error": str(e), "cached": False}
+            rows.append({"run": os.path.relpath(folder, root), **row})
+            if progress is not None:
+                progress(done, len(runs), "次实验")
+    finally:
+        # 任务取消时不再启动排队中的实验
+        pool.shutdown(cancel_futures=True)
+
+    summary = pd.DataFrame(rows)
+    if len(summary):
+        summary = summary.sort_values("run", ignore_index=True)
+    output_path = output_path or os.path.join(root, SUMMARY_FILE)
+    if pyarrow is None:
+        output_path = os.path.splitext(output_path)[0] + ".pkl"
+        print(f"未安装 pyarrow，汇总表保存为 {output_path}")
+        summary.to_pickle(output_path)
+    else:
+        tmp_path = output_path + ".tmp"
+        summary.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, output_path)
+    summary.attrs["output_path"] = output_path
+    return summary
+
+
+def batch_analysis_job(root, output_path=None, progress=None, **params) -> str:
+    """后台任务：批量分析（见 run_batch），返回结果说明"""
+    summary = run_batch(root, output_path, progress=progress, **params)
+    cached = int(summary["cached"].sum()) if "cached" in summary else 0
+    return (
+        f"{len(summary)} 次实验（{cached} 次复用已有结果）的汇总表已保存到 "
+        f"{summary.attrs['output_path']}"
+    )
+
+
+def find_summary(root) -> str | None:
+    """root 下已保存的汇总表路径，没有时返回 None"""
+    parquet_path = os.path.join(root, SUMMARY_FILE)
+    if pyarrow is not None and os.path.exists(parquet_path):
+        return parquet_path
+    pkl_path = os.path.splitext(parquet_path)[0] + ".pkl"
+    return pkl_path if os.path.exists(pkl_path) else None
+
+
+def load_summary(summary_path) -> pd.DataFrame:
+    if summary_path.endswith(".parquet"):
+        return pd.read_parquet(summary_path)
+    return pd.read_pickle(summary_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="包含各次实验文件夹的根目录")
+    parser.add_argument(
+        "--wavelengths", type=float, nargs="*", default=[1550.0], help="拟合损耗的波长 (nm)"
+    )
+    parser.add_argument("--cut-off", type=float, default=1.0, help="直径频谱截断频率 (Hz)")
+    parser.add_argument("--peaks", type=int, default=3, help="记录的频谱峰数")
+    parser.add_argument("--workers", type=int, default=None, help="进程数")
+    parser.add_argument("--output", default=None, help="汇总表路径")
+    args = parser.parse_args()
+
+    def show_progress(done, total, unit):
+        print(f"\r{done}/{total} {unit}", end="", flush=True)
+
+    summary = run_batch(
+        args.root,
+        args.output,
+        args.wavelengths,
+        args.cut_off,
+        args.peaks,
+        args.workers,
+        show_progress,
+    )
+    print()
+    print(summary.to_string())
+    print(f"已保存到 {summary.attrs['output_path']}")
@@ -0,0 +1,1079 @@
+import atexit
+import heapq
+import mmap
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import zstd
+
+try:
+    import zstandard
+except ImportError:  # 没有 zstandard 时退回 zstd.decompress（不能复用上下文，也不支持字典）
+    zstandard = None
+
+# .bin 文件格式：
+#   32 字节文件头
+#   之后每一帧：4 字节小端帧长度 + zstd 压缩的帧数据
+# 解压后的帧数据：24 字节帧头 ("I4H2If") + 像素数据
+FILE_HEADER_SIZE = 32
+LEN_SIZE = 4
+FRAME_HEADER_FORMAT = "I4H2If"
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_HEADER_FORMAT)
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),
+        ("length", "<u4"),
+        ("ts", "<i8"),
+        ("height", "<u2"),
+        ("width", "<u2"),
+        ("channels", "<u2"),
+        ("crc32", "<u4"),
+    ]
+)
+
+# sidecar 索引文件：LHPG-<ts>.bin.idx
+#   头部：magic、版本、帧数、.bin 文件大小、.bin 文件 mtime(ns)
+#   之后是 INDEX_DTYPE 的紧凑数组
+SIDECAR_SUFFIX = ".idx"
+SIDECAR_MAGIC = b"LHPGIDX\0"
+SIDECAR_VERSION = 1
+SIDECAR_HEADER_FORMAT = "<8sIQQq"
+SIDECAR_HEADER_SIZE = struct.calcsize(SIDECAR_HEADER_FORMAT)
+
+DECOMPRESS_ERRORS = (zstd.Error,) + ((zstandard.ZstdError,) if zstandard else ())
+
+_thread_local = threading.local()
+
+# 压缩包中的 .bin 文件，可以代替文件路径传给 CameraBinFile 及下面的各个函数
+ZipMember = namedtuple("ZipMember", ["zip_path", "name"])
+
+# backend="auto" 时，帧数达到这个值且 CPU 核数足够才使用进程池
+AUTO_PROCESS_MIN_FRAMES = 1000
+AUTO_PROCESS_MIN_CPUS = 4
+
+# stream_frames 每批解码的帧最多占用的内存
+STREAM_BATCH_BYTES = 256 << 20
+
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = threading.Lock()
+_process_pool_streams = 0  # 正在进行、可能用到进程池的 stream_frames 个数
+
+# 压缩包成员没有 sidecar，建好的索引和解压出的数据按 (压缩包, 成员名, 大小, CRC) 缓存在进程内，
+# 同一次导出中多次打开同一个成员（估计帧率、统计帧数、找首帧、解码）时不用重新扫描
+_zip_index_cache = OrderedDict()
+_zip_buffer_cache = OrderedDict()
+_zip_cache_lock = threading.Lock()
+ZIP_INDEX_CACHE_SIZE = 256
+ZIP_BUFFER_CACHE_BYTES = 1 << 30
+
+# 帧时间戳可能的单位（每秒多少个单位），用文件名里的秒级时间推断
+TS_UNITS_PER_SECOND = (1, 10**3, 10**6, 10**9)
+
+
+def load_zstd_dict(dict_path) -> bytes:
+    """读取录制端训练的 zstd 字典文件"""
+    with open(dict_path, "rb") as f:
+        return f.read()
+
+
+def _get_decompressor(zstd_dict=None):
+    """每个线程按字典各复用一个 zstandard 解压上下文"""
+    decompressors = getattr(_thread_local, "decompressors", None)
+    if decompressors is None:
+        decompressors = _thread_local.decompressors = {}
+    dctx = decompressors.get(zstd_dict)
+    if dctx is None:
+        if zstd_dict is None:
+            dctx = zstandard.ZstdDecompressor()
+        else:
+            dctx = zstandard.ZstdDecompressor(
+                dict_data=zstandard.ZstdCompressionDict(zstd_dict)
+            )
+        decompressors[zstd_dict] = dctx
+    return dctx
+
+
+def decompress_frame(frame_bytes, zstd_dict=None) -> bytes:
+    if zstandard is None:
+        if zstd_dict is not None:
+            raise ValueError("使用 zstd 字典需要安装 zstandard")
+        return zstd.decompress(frame_bytes)
+    return _get_decompressor(zstd_dict).decompress(frame_bytes)
+
+
+def _readinto_full(reader, buffer):
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = reader.readinto(view[filled:])
+        if n == 0:
+            raise ValueError("帧数据长度不足")
+        filled += n
+
+
+def _unpack_frame_header(header) -> tuple:
+    frame_header = struct.unpack_from(FRAME_HEADER_FORMAT, header)
+    ts = (frame_header[5] << 32) + frame_header[6]
+    return ts, frame_header[2], frame_header[3], frame_header[4]
+
+
+def decode_frame_header(frame_bytes, zstd_dict=None) -> tuple:
+    """只解出帧头，返回 (ts, height, width, channels)。
+
+    有 zstandard 时只解压到帧头所在的第一个块为止，不解压整帧。
+    """
+    if zstandard is not None:
+        reader = _get_decompressor(zstd_dict).stream_reader(frame_bytes)
+        header = bytearray(FRAME_HEADER_SIZE)
+        _readinto_full(reader, header)
+        return _unpack_frame_header(header)
+    return _unpack_frame_header(decompress_frame(frame_bytes, zstd_dict))
+
+
+def decode_frame_into(frame_bytes, out, zstd_dict=None) -> int:
+    """把一帧压缩数据直接解压到预分配的 out（C 连续，形状须与帧一致），返回时间戳"""
+    if zstandard is not None and out.ndim == 2:
+        # 先读 24 字节帧头，像素数据直接流式解压进 out，不经过中间 bytes
+        reader = _get_decompressor(zstd_dict).stream_reader(frame_bytes)
+        header = bytearray(FRAME_HEADER_SIZE)
+        _readinto_full(reader, header)
+        ts, height, width, channels = _unpack_frame_header(header)
+        if (height, width, channels) != (*out.shape, 1):
+            raise ValueError(
+                f"帧尺寸 {(height, width, channels)} 与输出数组 {out.shape} 不一致"
+            )
+        _readinto_full(reader, out)
+        return ts
+
+    frame = parse_frame(decompress_frame(frame_bytes, zstd_dict))
+    if frame is None or frame[1].shape != out.shape:
+        raise ValueError("帧数据无效或与输出数组尺寸不一致")
+    out[...] = frame[1]
+    return frame[0]
+
+
+def parse_frame(frame_bytes) -> tuple | None:
+    """解析解压后的帧数据，返回 (ts, ndarray)，ndarray 直接引用 frame_bytes 的内存"""
+    if len(frame_bytes) <= 0:
+        return None
+
+    try:
+        frame_header = struct.unpack_from(FRAME_HEADER_FORMAT, frame_bytes)
+        frame_length = frame_header[0]
+        height, width, channels = frame_header[2], frame_header[3], frame_header[4]
+        ts = (frame_header[5] << 32) + frame_header[6]
+        if channels == 1:
+            data = np.ndarray(
+                (height, width),
+                "B",
+                frame_bytes[:frame_length],
+                FRAME_HEADER_SIZE,
+                (width, 1),
+            )
+        else:  # untested
+            data = np.ndarray(
+                (height, width, channels),
+                "B",
+                frame_bytes[:frame_length],
+                FRAME_HEADER_SIZE,
+                (height * width, width, 1),
+            )
+        return ts, data
+    except Exception as e:
+        print(f"解析文件出错：{e}")
+        return None
+
+
+def source_name(file_path) -> str:
+    """.bin 文件名（不含目录），file_path 可以是路径或 ZipMember"""
+    if isinstance(file_path, ZipMember):
+        return os.path.basename(file_path.name)
+    return os.path.basename(file_path)
+
+
+def source_signature(file_path) -> list:
+    """判断 .bin 文件是否变化用的签名：文件为 [大小, mtime_ns]，压缩包成员为 [大小, CRC]"""
+    if isinstance(file_path, ZipMember):
+        with zipfile.ZipFile(file_path.zip_path) as zip_file:
+            info = zip_file.getinfo(file_path.name)
+        return [info.file_size, info.CRC]
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def frame_timestamps(file_path, indices=None) -> np.ndarray:
+    """从索引中取帧时间戳（不解压像素数据）"""
+    with CameraBinFile(file_path) as bin_file:
+        timestamps = bin_file.timestamps
+    return timestamps if indices is None else timestamps[indices]
+
+
+def zip_members(zip_path, suffix=".bin") -> list[ZipMember]:
+    """列出压缩包中的 .bin 文件"""
+    with zipfile.ZipFile(zip_path) as zip_file:
+        return [
+            ZipMember(zip_path, name)
+            for name in zip_file.namelist()
+            if name.endswith(suffix)
+        ]
+
+
+def build_frame_index(buffer, start=FILE_HEADER_SIZE) -> np.ndarray:
+    """扫描一遍帧长度前缀，返回每帧压缩数据的 offset/length 索引"""
+    size = len(buffer)
+    offsets = []
+    lengths = []
+    pos = start
+    while pos + LEN_SIZE <= size:
+        (frame_len,) = struct.unpack_from("<I", buffer, pos)
+        if frame_len == 0 or pos + LEN_SIZE + frame_len > size:
+            break
+        offsets.append(pos + LEN_SIZE)
+        lengths.append(frame_len)
+        pos += LEN_SIZE + frame_len
+
+    index = np.zeros(len(offsets), dtype=INDEX_DTYPE)
+    index["offset"] = offsets
+    index["length"] = lengths
+    index["ts"] = -1
+    return index
+
+
+def sidecar_path(file_path) -> str:
+    return file_path + SIDECAR_SUFFIX
+
+
+def _sidecar_frame_count(f, file_path) -> int | None:
+    """检查已打开的 sidecar 的头部，返回帧数；索引过期或不完整时返回 None"""
+    stat = os.stat(file_path)
+    header = f.read(SIDECAR_HEADER_SIZE)
+    if len(header) < SIDECAR_HEADER_SIZE:
+        return None
+    magic, version, n_frames, size, mtime_ns = struct.unpack(
+        SIDECAR_HEADER_FORMAT, header
+    )
+    if (
+        magic != SIDECAR_MAGIC
+        or version != SIDECAR_VERSION
+        or size != stat.st_size
+        or mtime_ns != stat.st_mtime_ns
+        or os.fstat(f.fileno()).st_size
+        < SIDECAR_HEADER_SIZE + n_frames * INDEX_DTYPE.itemsize
+    ):
+        return None
+    return n_frames
+
+
+def load_sidecar(file_path) -> np.ndarray | None:
+    """读取 sidecar 索引，文件大小或修改时间对不上（索引过期）时返回 None"""
+    try:
+        with open(sidecar_path(file_path), "rb") as f:
+            n_frames = _sidecar_frame_count(f, file_path)
+            if n_frames is None:
+                return None
+            index = np.fromfile(f, dtype=INDEX_DTYPE, count=n_frames)
+    except OSError:
+        return None
+    if len(index) != n_frames:
+        return None
+    return index
+
+
+def sidecar_frame_count(file_path) -> int | None:
+    """只读 sidecar 的头部取得帧数，没有 sidecar 或索引过期时返回 None"""
+    try:
+        with open(sidecar_path(file_path), "rb") as f:
+            return _sidecar_frame_count(f, file_path)
+    except OSError:
+        return None
+
+
+def save_sidecar(file_path, index, source_stat=None):
+    """写入 sidecar 索引（先写临时文件再替换，避免留下半个索引）。
+
+    source_stat 为建立索引时 .bin 文件的 (大小, mtime_ns)，默认取当前的文件状态。
+    """
+    if source_stat is None:
+        stat = os.stat(file_path)
+        source_stat = (stat.st_size, stat.st_mtime_ns)
+    header = struct.pack(
+        SIDECAR_HEADER_FORMAT,
+        SIDECAR_MAGIC,
+        SIDECAR_VERSION,
+        len(index),
+        *source_stat,
+    )
+    idx_path = sidecar_path(file_path)
+    tmp_path = idx_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            index.astype(INDEX_DTYPE, copy=False).tofile(f)
+        os.replace(tmp_path, idx_path)
+    except OSError as e:
+        print(f"写入索引文件 {idx_path} 出错：{e}")
+
+
+class CameraBinFile:
+    """以内存映射方式读取相机 .bin 文件。
+
+    打开时只扫描一遍帧长度前缀建立索引，之后按帧号或时间戳随机访问，
+    压缩数据以映射内存上的切片交给解压，不做额外拷贝。
+    完整的帧信息（时间戳、宽高、通道数、校验和）保存在旁边的 .bin.idx 文件中，
+    只有 .bin 文件的大小或修改时间变化时才重新生成。
+
+    Example:
+        with CameraBinFile(path) as bin_file:
+            ts, frame = bin_file.read_frame(0)
+    """
+
+    def __init__(self, file_path, use_sidecar=True, zstd_dict=None, index=None):
+        self.file_path = file_path
+        self.zstd_dict = zstd_dict
+        self._file = None
+        self._mmap = None
+        self._zip_key = None
+        self._source_stat = None
+        # 压缩过的压缩包成员整个解压在本进程内存中，不适合交给进程池（见 _resolve_backend）
+        self.inflated = False
+        if isinstance(file_path, ZipMember):
+            # 压缩包里没法放 sidecar 索引，索引缓存在进程内（见 _zip_index_cache）
+            use_sidecar = False
+            self._buffer = self._open_zip_member(file_path)
+            if index is None:
+                with _zip_cache_lock:
+                    index = _zip_index_cache.get(self._zip_key)
+                    if index is not None:
+                        # 按最近使用淘汰，常用的成员不会被新打开的成员挤掉
+                        _zip_index_cache.move_to_end(self._zip_key)
+        else:
+            self._file = open(file_path, "rb")
+            # 映射时的文件大小和修改时间，写 sidecar 时用它们而不是写入时的文件状态：
+            # 录制中的文件在打开后还会变长，索引只覆盖映射到的部分
+            stat = os.fstat(self._file.fileno())
+            size = stat.st_size
+            self._source_stat = (size, stat.st_mtime_ns)
+            if size > FILE_HEADER_SIZE:
+                self._mmap = mmap.mmap(
+                    self._file.fileno(), size, access=mmap.ACCESS_READ
+                )
+                # zstd.decompress 不接受 memoryview/mmap，只接受没有 releasebuffer 的对象，
+                # 所以用只读 ndarray 包一层，切片同样是零拷贝
+                self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+            else:
+                self._buffer = np.empty(0, dtype=np.uint8)
+        self.use_sidecar = use_sidecar
+        if index is None and use_sidecar:
+            index = load_sidecar(file_path)
+        self.indexed = index is not None
+        if self.indexed:
+            self.index = index
+            self._info_known = np.ones(len(index), dtype=bool)
+        else:
+            self.index = build_frame_index(self._buffer)
+            self._info_known = np.zeros(len(self.index), dtype=bool)
+        self._ts_order = None
+
+    def _open_zip_member(self, member) -> np.ndarray:
+        """不解压到磁盘，直接读取压缩包中的 .bin 文件。
+
+        未压缩（ZIP_STORED）的成员按偏移量映射压缩包文件，零拷贝；
+        压缩过的成员只能整个读进内存。每次打开都用自己的 ZipFile 句柄，可以多线程并行。
+        """
+        with zipfile.ZipFile(member.zip_path) as zip_file:
+            info = zip_file.getinfo(member.name)
+            self._zip_key = (member.zip_path, member.name, info.file_size, info.CRC)
+            if info.compress_type != zipfile.ZIP_STORED:
+                self.inflated = True
+                with _zip_cache_lock:
+                    buffer = _zip_buffer_cache.get(self._zip_key)
+                    if buffer is not None:
+                        _zip_buffer_cache.move_to_end(self._zip_key)
+                        return buffer
+                with zip_file.open(info) as f:
+                    buffer = np.frombuffer(f.read(), dtype=np.uint8)
+                _cache_zip_buffer(self._zip_key, buffer)
+                return buffer
+
+        self._file = open(member.zip_path, "rb")
+        # 成员数据在本地文件头之后：30 字节固定头 + 文件名 + extra 字段
+        self._file.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack("<HH", self._file.read(4))
+        data_offset = info.header_offset + 30 + name_len + extra_len
+        if info.file_size <= FILE_HEADER_SIZE:
+            return np.empty(0, dtype=np.uint8)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(
+            self._mmap, dtype=np.uint8, count=info.file_size, offset=data_offset
+        )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._buffer = np.empty(0, dtype=np.uint8)
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有帧数据引用着映射内存，交给垃圾回收释放
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+
+    def frame_bytes(self, i) -> np.ndarray:
+        """第 i 帧的压缩数据（不含长度前缀），零拷贝的只读 uint8 视图，
+        需要 memoryview 时直接 memoryview(bin_file.frame_bytes(i))"""
+        offset = int(self.index["offset"][i])
+        length = int(self.index["length"][i])
+        return self._buffer[offset : offset + length]
+
+    def decompress(self, i) -> bytes:
+        return decompress_frame(self.frame_bytes(i), self.zstd_dict)
+
+    def read_frame(self, i) -> tuple | None:
+        """解码第 i 帧，返回 (ts, ndarray)"""
+        try:
+            frame_bytes = self.decompress(i)
+        except DECOMPRESS_ERRORS as e:
+            print(f"解压文件 {self.file_path} 第 {i} 帧出错：{e}")
+            self._info_known[i] = True
+            return None
+        frame = parse_frame(frame_bytes)
+        if not self._info_known[i]:
+            # 顺便记下帧信息，之后写 sidecar 时不必再解压一次
+            self._record_frame_info(i, frame)
+        return frame
+
+    def _record_frame_info(self, i, frame):
+        if frame is not None:
+            ts, data = frame
+            self.index["ts"][i] = ts
+            self.index["height"][i], self.index["width"][i] = data.shape[:2]
+            self.index["channels"][i] = data.shape[2] if data.ndim == 3 else 1
+        self._info_known[i] = True
+
+    def _read_frame_info(self, i):
+        """只解帧头来记录帧信息"""
+        try:
+            ts, height, width, channels = decode_frame_header(
+                self.frame_bytes(i), self.zstd_dict
+            )
+            self.index["ts"][i] = ts
+            self.index["height"][i] = height
+            self.index["width"][i] = width
+            self.index["channels"][i] = channels
+        except (ValueError, struct.error, *DECOMPRESS_ERRORS) as e:
+            print(f"解析文件 {self.file_path} 第 {i} 帧帧头出错：{e}")
+        self._info_known[i] = True
+
+    @property
+    def has_frame_info(self) -> bool:
+        return bool(self._info_known.all())
+
+    def ensure_frame_info(self, max_workers=None):
+        """补全所有帧的时间戳、尺寸和校验和，并写入 sidecar 索引"""
+        if self.indexed:
+            return
+        unknown = np.flatnonzero(~self._info_known)
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(self._read_frame_info, unknown))
+        self._ts_order = None
+        self.indexed = True
+        if self._zip_key is not None:
+            # 压缩包成员有压缩包自己的 CRC，逐帧校验和等到 verify 时才计算
+            with _zip_cache_lock:
+                _zip_index_cache[self._zip_key] = self.index
+                while len(_zip_index_cache) > ZIP_INDEX_CACHE_SIZE:
+                    _zip_index_cache.popitem(last=False)
+            return
+        self.index["crc32"] = [
+            zlib.crc32(self.frame_bytes(i)) for i in range(len(self))
+        ]
+        if self.use_sidecar:
+            save_sidecar(self.file_path, self.index, self._source_stat)
+
+    def verify(self, i) -> bool:
+        """用 sidecar 中的校验和检查第 i 帧的压缩数据是否完好"""
+        self.ensure_frame_info()
+        if self._zip_key is not None and not self.index["crc32"].any():
+            # 索引在进程内共用，压缩包成员的逐帧校验和只在第一次 verify 时算一遍
+            self.index["crc32"] = [
+                zlib.crc32(self.frame_bytes(k)) for k in range(len(self))
+            ]
+        return zlib.crc32(self.frame_bytes(i)) == self.index["crc32"][i]
+
+    def frame_shape(self) -> tuple:
+        """帧的形状 (H, W) 或 (H, W, C)，取第一个有效帧"""
+        if self.indexed:
+            valid = np.flatnonzero(self.index["ts"] >= 0)
+            if len(valid):
+                entry = self.index[valid[0]]
+                if entry["channels"] == 1:
+                    return int(entry["height"]), int(entry["width"])
+                return int(entry["height"]), int(entry["width"]), int(entry["channels"])
+        for i in range(len(self)):
+            frame = self.read_frame(i)
+            if frame is not None:
+                return frame[1].shape
+        raise ValueError(f"文件 {self.file_path} 中没有有效的帧")
+
+    def read_frames(
+        self,
+        indices=None,
+        out=None,
+        max_workers=None,
+        chunk_size=64,
+        backend="thread",
+    ):
+        """批量解码到预分配的 (n_frames, H, W) uint8 数组。
+
+        每个工作线程处理连续的 chunk_size 帧并复用自己的解压上下文。
+        Args:
+            indices: 要解码的帧号，默认全部
+            out: 预分配的输出数组，默认新建
+            max_workers: 线程/进程数
+            chunk_size: 每个任务解码的帧数
+            backend: "thread"、"process" 或 "auto"（帧多、核多时用进程池）；
+                压缩过的压缩包成员总是用线程池
+        Returns:
+            (timestamps, frames)，解码失败的帧时间戳为 -1
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        if out is None:
+            shape = self.frame_shape() if len(indices) else (0, 0)
+            out = np.empty((len(indices), *shape), dtype=np.uint8)
+
+        backend = self._resolve_backend(backend, len(indices))
+        if backend == "process":
+            timestamps, out = self._read_frames_in_processes(indices, out, max_workers)
+            self._record_batch_info(indices, timestamps, out.shape[1:])
+            return timestamps, out
+        if backend != "thread":
+            raise ValueError(f"未知的解码后端：{backend}")
+
+        timestamps = np.full(len(indices), -1, dtype=np.int64)
+
+        def decode_chunk(start):
+            for j in range(start, min(start + chunk_size, len(indices))):
+                try:
+                    timestamps[j] = decode_frame_into(
+                        self.frame_bytes(indices[j]), out[j], self.zstd_dict
+                    )
+                except (ValueError, struct.error, *DECOMPRESS_ERRORS) as e:
+                    print(f"解码文件 {self.file_path} 第 {indices[j]} 帧出错：{e}")
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(decode_chunk, range(0, len(indices), chunk_size)))
+        self._record_batch_info(indices, timestamps, out.shape[1:])
+        return timestamps, out
+
+    def _resolve_backend(self, backend, n_frames) -> str:
+        """把 "auto" 换成实际的后端。
+
+        压缩过的压缩包成员只能整个解压，进程池的每个子进程都要各自再解压一遍
+        （成员太大放不进缓存时每批都要重新解压），所以一律改用线程池。
+        """
+        if backend == "auto":
+            backend = _auto_backend(n_frames)
+        if backend == "process" and self.inflated:
+            return "thread"
+        return backend
+
+    def _record_batch_info(self, indices, timestamps, shape):
+        unknown = ~self._info_known[indices]
+        if not unknown.any():
+            return
+        indices, timestamps = indices[unknown], timestamps[unknown]
+        decoded = indices[timestamps >= 0]
+        self.index["ts"][decoded] = timestamps[timestamps >= 0]
+        self.index["height"][decoded], self.index["width"][decoded] = shape[:2]
+        self.index["channels"][decoded] = shape[2] if len(shape) == 3 else 1
+        self._info_known[indices] = True
+
+    def _read_frames_in_processes(self, indices, out, max_workers):
+        """进程池解码：子进程直接写入共享内存，只有时间戳经过 pickle 传回"""
+        timestamps = np.full(len(indices), -1, dtype=np.int64)
+        if len(indices) == 0:
+            return timestamps, out
+        executor = _get_process_pool(max_workers)
+        n_tasks = (max_workers or os.cpu_count() or 1) * 4
+        chunk_size = max(64, -(-len(indices) // n_tasks))
+        shm = shared_memory.SharedMemory(create=True, size=max(out.nbytes, 1))
+        try:
+            futures = []
+            for start in range(0, len(indices), chunk_size):
+                # 只把这一段帧的 offset/length 交给子进程，子进程不用重新扫描文件
+                chunk_index = self.index[indices[start : start + chunk_size]]
+                futures.append(
+                    executor.submit(
+                        _decode_chunk_to_shared_memory,
+                        self.file_path,
+                        chunk_index,
+                        self.zstd_dict,
+                        shm.name,
+                        out.shape,
+                        start,
+                    )
+                )
+            for start, future in zip(range(0, len(indices), chunk_size), futures):
+                chunk_timestamps = future.result()
+                timestamps[start : start + len(chunk_timestamps)] = chunk_timestamps
+            out[...] = np.ndarray(out.shape, dtype=np.uint8, buffer=shm.buf)
+        finally:
+            shm.close()
+            shm.unlink()
+        return timestamps, out
+
+    def chronological_indices(self):
+        """按时间戳排序的帧号；没有 sidecar 或本来就有序时直接用文件顺序"""
+        if self.indexed:
+            timestamps = self.index["ts"]
+            if np.any(timestamps[1:] < timestamps[:-1]):
+                return np.argsort(timestamps, kind="stable")
+        return range(len(self))
+
+    def iter_frames(self, indices=None, max_workers=None, window=64):
+        """多线程解码，按 indices（默认文件顺序）逐帧产出 (ts, ndarray)。
+
+        同时在解码中的帧不超过 window 个，内存占用与文件长度无关。
+        """
+        if indices is None:
+            indices = range(len(self))
+        with ThreadPoolExecutor(max_workers) as executor:
+            pending = deque()
+            try:
+                for i in indices:
+                    pending.append(executor.submit(self.read_frame, i))
+                    if len(pending) >= window:
+                        frame = pending.popleft().result()
+                        if frame is not None:
+                            yield frame
+                while pending:
+                    frame = pending.popleft().result()
+                    if frame is not None:
+                        yield frame
+            finally:
+                # 使用方提前结束时丢掉还没开始的解码任务
+                for future in pending:
+                    future.cancel()
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """每帧的时间戳（没有 sidecar 时首次访问会解压全部帧并生成 sidecar）"""
+        if not self.has_frame_info:
+            self.ensure_frame_info()
+        return self.index["ts"]
+
+    def frame_at(self, ts) -> int:
+        """返回时间戳不晚于 ts 的最后一帧的帧号"""
+        timestamps = self.timestamps
+        if self._ts_order is None:
+            self._ts_order = np.argsort(timestamps, kind="stable")
+        order = self._ts_order
+        pos = np.searchsorted(timestamps[order], ts, side="right") - 1
+        return int(order[max(pos, 0)])
+
+    def read_frame_at(self, ts) -> tuple | None:
+        return self.read_frame(self.frame_at(ts))
+
+
+def _cache_zip_buffer(key, buffer):
+    """缓存解压出的压缩包成员，总大小超过 ZIP_BUFFER_CACHE_BYTES 时丢掉最久没用的"""
+    if buffer.nbytes > ZIP_BUFFER_CACHE_BYTES:
+        return
+    with _zip_cache_lock:
+        _zip_buffer_cache[key] = buffer
+        total = sum(b.nbytes for b in _zip_buffer_cache.values())
+        while total > ZIP_BUFFER_CACHE_BYTES:
+            _, dropped = _zip_buffer_cache.popitem(last=False)
+            total -= dropped.nbytes
+
+
+def _decode_chunk_to_shared_memory(file_path, index, zstd_dict, shm_name, shape, start):
+    """在子进程中解码一段帧，写入共享内存中 [start, start + len(index)) 的位置"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+        with CameraBinFile(file_path, zstd_dict=zstd_dict, index=index) as bin_file:
+            timestamps = bin_file.read_frames(
+                out=frames[start : start + len(index)], max_workers=1
+            )[0]
+        del frames
+    finally:
+        shm.close()
+    return timestamps
+
+
+def _get_process_pool(max_workers=None) -> ProcessPoolExecutor:
+    """进程池在一次导出内复用，避免每个文件都重新启动子进程。
+
+    调用方（stream_frames、后台任务）本身运行在多线程的进程中，fork 出的子进程
+    可能继承被占用的锁而卡死，所以与 _jobs 一样用 spawn 启动。
+    """
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != max_workers:
+            if _process_pool is not None:
+                _process_pool.shutdown()
+            _process_pool = ProcessPoolExecutor(
+                max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _process_pool_workers = max_workers
+        return _process_pool
+
+
+def _close_process_pool():
+    global _process_pool, _process_pool_workers
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+    _process_pool = _process_pool_workers = None
+
+
+@atexit.register
+def _shutdown_process_pool():
+    with _process_pool_lock:
+        _close_process_pool()
+
+
+def _acquire_process_pool():
+    global _process_pool_streams
+    with _process_pool_lock:
+        _process_pool_streams += 1
+
+
+def _release_process_pool():
+    """stream_frames 结束时调用，没有其他正在进行的流时关闭进程池，
+    不在每个后台任务进程中留下 cpu_count 个空闲子进程"""
+    global _process_pool_streams
+    with _process_pool_lock:
+        _process_pool_streams -= 1
+        if _process_pool_streams == 0:
+            _close_process_pool()
+
+
+_END_OF_STREAM = object()
+
+
+def _put_until_stopped(frame_queue, item, stop_event) -> bool:
+    while not stop_event.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def ts_per_second(ts, file_path) -> int:
+    """根据文件名中的秒级时间（LHPG-<秒>.bin）推断帧时间戳每秒多少个单位"""
+    file_seconds = int(os.path.splitext(source_name(file_path))[0].split("-")[-1])
+    return min(TS_UNITS_PER_SECOND, key=lambda scale: abs(ts / scale - file_seconds))
+
+
+def frame_timeline(file_paths, start_ts=None, end_ts=None) -> tuple:
+    """所有文件的有效帧按时间排好的序列（时间戳相同时按文件、帧号排）。
+
+    只用到索引中的时间戳，不解压像素数据。
+    Returns:
+        (file_ids, frame_ids, timestamps)，三个等长数组
+    """
+    file_ids, frame_ids, timestamps = [], [], []
+    for file_index, file_path in enumerate(file_paths):
+        with CameraBinFile(file_path) as bin_file:
+            ts = bin_file.timestamps
+        keep = ts >= 0
+        if start_ts is not None:
+            keep &= ts >= start_ts
+        if end_ts is not None:
+            keep &= ts <= end_ts
+        frame_index = np.flatnonzero(keep)
+        file_ids.append(np.full(len(frame_index), file_index))
+        frame_ids.append(frame_index)
+        timestamps.append(ts[frame_index])
+
+    file_ids = np.concatenate(file_ids) if file_ids else np.empty(0, dtype=int)
+    frame_ids = np.concatenate(frame_ids) if frame_ids else np.empty(0, dtype=int)
+    timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=int)
+    order = np.lexsort((frame_ids, file_ids, timestamps))
+    return file_ids[order], frame_ids[order], timestamps[order]
+
+
+def select_frames(
+    file_paths,
+    start_ts=None,
+    end_ts=None,
+    start_frame=None,
+    end_frame=None,
+    stride=1,
+) -> list[np.ndarray]:
+    """挑出要解码的帧，返回每个文件按时间顺序排列的帧号数组。
+
+    先按时间窗口 [start_ts, end_ts] 过滤，再在所有文件按时间排好的帧序列中
+    取 [start_frame, end_frame) 并每 stride 帧取一帧。只用到索引中的时间戳，
+    不解压像素数据；没被选中的帧之后也不会被解压。
+    """
+    file_ids, frame_ids, _ = frame_timeline(file_paths, start_ts, end_ts)
+    file_ids = file_ids[start_frame:end_frame:stride]
+    frame_ids = frame_ids[start_frame:end_frame:stride]
+    return [frame_ids[file_ids == i] for i in range(len(file_paths))]
+
+
+def recording_summary(file_paths) -> dict:
+    """多个文件合起来的帧数、首末帧时间戳和时间戳单位"""
+    first_ts, last_ts, n_frames = None, None, 0
+    for file_path in file_paths:
+        with CameraBinFile(file_path) as bin_file:
+            ts = bin_file.timestamps
+        ts = ts[ts >= 0]
+        if len(ts) == 0:
+            continue
+        n_frames += len(ts)
+        first_ts = ts.min() if first_ts is None else min(first_ts, ts.min())
+        last_ts = ts.max() if last_ts is None else max(last_ts, ts.max())
+    scale = ts_per_second(first_ts, file_paths[0]) if first_ts is not None else 1
+    return {
+        "n_frames": n_frames,
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "ts_per_second": scale,
+    }
+
+
+def estimate_fps(file_paths, indices=None) -> float | None:
+    """由帧时间戳估计帧率（相邻帧时间间隔的中位数），没有足够的帧时返回 None"""
+    intervals = []
+    scale = None
+    for file_index, file_path in enumerate(file_paths):
+        with CameraBinFile(file_path) as bin_file:
+            ts = bin_file.timestamps
+        if indices is not None:
+            ts = ts[indices[file_index]]
+        ts = np.sort(ts[ts >= 0])
+        if len(ts) < 2:
+            continue
+        if scale is None:
+            scale = ts_per_second(ts[0], file_path)
+        intervals.append(np.diff(ts))
+    if not intervals:
+        return None
+    interval = np.median(np.concatenate(intervals))
+    return scale / interval if interval > 0 else None
+
+
+def _auto_backend(n_frames) -> str:
+    """帧多、核多时用进程池，否则用线程池"""
+    use_process = (
+        n_frames >= AUTO_PROCESS_MIN_FRAMES
+        and (os.cpu_count() or 1) >= AUTO_PROCESS_MIN_CPUS
+    )
+    return "process" if use_process else "thread"
+
+
+def _iter_file(
+    file_index, file_path, max_workers, window, indices=None, backend="auto"
+):
+    """逐批调用 read_frames 解码一个文件，逐帧产出 (file_index, ts, ndarray)。
+
+    线程池每批约 window 帧；进程池每批给每个进程 64 帧，才能用满所有核。
+    每批的帧数同时受 STREAM_BATCH_BYTES 限制。
+    """
+    with CameraBinFile(file_path) as bin_file:
+        if indices is None:
+            indices = bin_file.chronological_indices()
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            return
+        backend = bin_file._resolve_backend(backend, len(indices))
+        n_workers = max_workers or os.cpu_count() or 1
+        batch_size = max(window, n_workers * (64 if backend == "process" else 4))
+        frame_bytes = int(np.prod(bin_file.frame_shape()))
+        batch_size = max(1, min(batch_size, STREAM_BATCH_BYTES // max(frame_bytes, 1)))
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start : start + batch_size]
+            timestamps, frames = bin_file.read_frames(
+                batch,
+                max_workers=max_workers,
+                chunk_size=max(1, -(-len(batch) // n_workers)),
+                backend=backend,
+            )
+            # 每批新建输出数组，队列中还没用掉的帧不会被下一批覆盖
+            for ts, frame in zip(timestamps, frames):
+                if ts >= 0:
+                    yield file_index, int(ts), frame
+        bin_file.ensure_frame_info()
+
+
+def _first_timestamp(file_path, indices=None):
+    with CameraBinFile(file_path) as bin_file:
+        if bin_file.indexed:
+            timestamps = bin_file.index["ts"]
+            if indices is not None:
+                timestamps = timestamps[indices]
+            timestamps = timestamps[timestamps >= 0]
+            return int(timestamps.min()) if len(timestamps) else None
+        for ts, _ in bin_file.iter_frames(indices, max_workers=1, window=1):
+            return ts
+    return None
+
+
+def sort_by_start(file_paths) -> list:
+    """按首帧时间戳排序（没有有效帧的文件排在最后），用于按文件顺序拼接的导出"""
+    starts = [_first_timestamp(file_path) for file_path in file_paths]
+    order = sorted(
+        range(len(file_paths)),
+        key=lambda k: (starts[k] is None, starts[k] or 0, k),
+    )
+    return [file_paths[k] for k in order]
+
+
+def iter_file_frames(
+    file_paths, max_workers=None, window=64, indices=None, backend="auto"
+):
+    """逐个文件按时间顺序解码，产出 (file_index, ts, ndarray)。
+
+    indices 为每个文件要解码的帧号（见 select_frames），默认全部。
+    backend 为 read_frames 的解码后端。
+    """
+    for file_index, file_path in enumerate(file_paths):
+        file_indices = None if indices is None else indices[file_index]
+        if file_indices is not None and len(file_indices) == 0:
+            continue
+        yield from _iter_file(
+            file_index, file_path, max_workers, window, file_indices, backend
+        )
+
+
+def iter_merged_frames(
+    file_paths, max_workers=None, window=64, indices=None, backend="auto"
+):
+    """按时间戳交错多个文件的帧，产出 (file_index, ts, ndarray)。
+
+    每个文件内部本来就是有序的，这里只做多路归并，不需要整体排序。
+    文件按首帧时间排队，归并到它的起始时间时才开始解码，
+    所以同时在解码的只有时间上重叠的几个文件。
+    indices 为每个文件要解码的帧号（见 select_frames），默认全部。
+    """
+    if indices is None:
+        indices = [None] * len(file_paths)
+    starts = []
+    for file_index, file_path in enumerate(file_paths):
+        if indices[file_index] is not None and len(indices[file_index]) == 0:
+            continue
+        start = _first_timestamp(file_path, indices[file_index])
+        if start is not None:
+            starts.append((start, file_index, file_path))
+    pending = deque(sorted(starts))
+    heap = []
+    active = []
+    seq = 0
+
+    def push_next(frames):
+        nonlocal seq
+        item = next(frames, None)
+        if item is not None:
+            file_index, ts, data = item
+            heapq.heappush(heap, (ts, file_index, seq, data, frames))
+            seq += 1
+
+    try:
+        while heap or pending:
+            while pending and (not heap or pending[0][0] <= heap[0][0]):
+                _, file_index, file_path = pending.popleft()
+                frames = _iter_file(
+                    file_index,
+                    file_path,
+                    max_workers,
+                    window,
+                    indices[file_index],
+                    backend,
+                )
+                active.append(frames)
+                push_next(frames)
+            if not heap:
+                continue
+            ts, file_index, _, data, frames = heapq.heappop(heap)
+            yield file_index, ts, data
+            push_next(frames)
+    finally:
+        for frames in active:
+            frames.close()
+
+
+def _decode_files(frames, frame_queue, stop_event):
+    try:
+        for item in frames:
+            if not _put_until_stopped(frame_queue, item, stop_event):
+                return
+    except Exception as e:
+        _put_until_stopped(frame_queue, e, stop_event)
+    finally:
+        frames.close()
+        _put_until_stopped(frame_queue, _END_OF_STREAM, stop_event)
+
+
+def stream_frames(
+    file_paths,
+    queue_size=128,
+    max_workers=None,
+    window=64,
+    merge=False,
+    indices=None,
+    backend="auto",
+):
+    """在后台线程中按顺序解码多个 .bin 文件，逐帧产出 (file_index, ts, ndarray)。
+
+    解码与使用方（例如视频编码）同时进行，两者之间是容量为 queue_size 的有界队列：
+    使用方处理得慢时解码线程会阻塞等待，内存占用不随录像长度增长。
+    merge=True 时按时间戳交错所有文件（见 iter_merged_frames），否则逐个文件输出。
+    indices 为每个文件要解码的帧号（见 select_frames），默认全部。
+    backend 为 read_frames 的解码后端："thread"、"process" 或 "auto"
+    （帧多、核多时用共享内存的进程池）。
+    """
+    iter_frames = iter_merged_frames if merge else iter_file_frames
+    frames = iter_frames(
+        file_paths,
+        max_workers=max_workers,
+        window=window,
+        indices=indices,
+        backend=backend,
+    )
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=_decode_files,
+        args=(frames, frame_queue, stop_event),
+        daemon=True,
+    )
+    _acquire_process_pool()
+    producer.start()
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop_event.set()
+        producer.join()
+        _release_process_pool()
@@ -0,0 +1,505 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from _camera_bin import (
+    frame_timestamps,
+    source_name,
+    source_signature,
+    stream_frames,
+)
+
+IMAGE_FORMATS = {"jpg": ".jpg", "png": ".png", "webp": ".webp", "npy": ".npy"}
+IMAGE_ENCODERS = ("cv2", "pil")
+
+# 导出结果的位置：图片在数据文件夹的 photo/ 中，分段视频的片段在 <视频名>.segments/ 中
+PHOTO_FOLDER = "photo"
+SEGMENT_SUFFIX = ".segments"
+
+
+def _encode_cv2(data, image_format, quality) -> bytes:
+    if image_format == "jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif image_format == "png":
+        # quality 越高压缩越快、文件越大：100 -> 0 级压缩，0 -> 9 级压缩
+        params = [cv2.IMWRITE_PNG_COMPRESSION, int(round((100 - quality) / 100 * 9))]
+    else:
+        # OpenCV 中 WebP 质量大于 100 即为无损
+        params = [cv2.IMWRITE_WEBP_QUALITY, 101]
+    ok, buffer = cv2.imencode(IMAGE_FORMATS[image_format], data, params)
+    if not ok:
+        raise ValueError(f"编码 {image_format} 图片失败")
+    return buffer.tobytes()
+
+
+def _save_pil(data, image_path, image_format, quality):
+    image = Image.fromarray(data)
+    pil_format = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}[image_format]
+    if image_format == "jpg":
+        image.save(image_path, pil_format, quality=int(quality))
+    elif image_format == "png":
+        image.save(
+            image_path, pil_format, compress_level=int(round((100 - quality) / 100 * 9))
+        )
+    else:
+        image.save(image_path, pil_format, lossless=True)
+
+
+def _truncate_npy(npy_path, n_rows):
+    """把 .npy 文件的第一维截短为 n_rows：原地改写头部并截断文件，不复制数据"""
+    npy_format = np.lib.format
+    header_io = {
+        (1, 0): (npy_format.read_array_header_1_0, npy_format.write_array_header_1_0),
+        (2, 0): (npy_format.read_array_header_2_0, npy_format.write_array_header_2_0),
+    }
+    with open(npy_path, "r+b") as f:
+        read_header, write_header = header_io[npy_format.read_magic(f)]
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+        f.seek(0)
+        # numpy 为第一维的位数变化预留了空白，头部长度不变
+        write_header(
+            f,
+            {
+                "descr": npy_format.dtype_to_descr(dtype),
+                "fortran_order": fortran_order,
+                "shape": (n_rows, *shape[1:]),
+            },
+        )
+        if f.tell() != offset:
+            raise ValueError(f"改写 {npy_path} 的头部失败")
+        f.truncate(offset + n_rows * int(np.prod(shape[1:])) * dtype.itemsize)
+
+
+class ImageExporter:
+    """把解码后的帧批量保存为图片。
+
+    编码在固定大小的线程池里进行，同时在途的帧不超过 max_in_flight 个，
+    已存在的文件用一次目录列表判断并跳过。npy 格式把所有帧写进一个 (N, H, W) 数组文件。
+
+    Example:
+        exporter = ImageExporter(photo_folder, "jpg", quality=90)
+        stats = exporter.export(file_paths, indices)
+    """
+
+    def __init__(
+        self,
+        output_folder,
+        image_format="jpg",
+        quality=95,
+        encoder="cv2",
+        max_workers=None,
+        max_in_flight=None,
+    ):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图片格式：{image_format}")
+        if encoder not in IMAGE_ENCODERS:
+            raise ValueError(f"不支持的编码器：{encoder}")
+        self.output_folder = output_folder
+        self.image_format = image_format
+        self.quality = quality
+        self.encoder = encoder
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.max_in_flight = max_in_flight or self.max_workers * 4
+
+    def _save(self, ts, data):
+        image_path = os.path.join(
+            self.output_folder, f"{ts}{IMAGE_FORMATS[self.image_format]}"
+        )
+        # 先写临时文件再改名，中断时不会留下写了一半、下次又被跳过的图片
+        tmp_path = image_path + ".tmp"
+        if self.encoder == "cv2":
+            encoded = _encode_cv2(data, self.image_format, self.quality)
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+        else:
+            _save_pil(data, tmp_path, self.image_format, self.quality)
+        os.replace(tmp_path, image_path)
+
+    def export(self, file_paths, indices=None, progress=None) -> dict:
+        """导出 file_paths 中（indices 选中的）帧。
+
+        Args:
+            file_paths: .bin 文件路径列表
+            indices: 每个文件要导出的帧号（见 select_frames），默认全部
+            progress: 回调 progress(done, total)，total 未知时为 None
+        Returns:
+            {"saved": 保存帧数, "skipped": 跳过帧数, "seconds": 用时, "fps": 帧/秒}
+        """
+        os.makedirs(self.output_folder, exist_ok=True)
+        total = sum(len(i) for i in indices) if indices is not None else None
+        start = time.perf_counter()
+        if self.image_format == "npy":
+            saved, skipped = self._export_npy(file_paths, indices, total, progress)
+        else:
+            saved, skipped = self._export_images(file_paths, indices, total, progress)
+        seconds = time.perf_counter() - start
+        return {
+            "saved": saved,
+            "skipped": skipped,
+            "seconds": seconds,
+            "fps": saved / seconds if seconds > 0 else 0.0,
+        }
+
+    def _export_images(self, file_paths, indices, total, progress):
+        # 一次列出已有文件，代替每帧一次 os.path.exists
+        existing = set(os.listdir(self.output_folder))
+        suffix = IMAGE_FORMATS[self.image_format]
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        saved = 0
+        errors = []
+
+        # 按索引里的时间戳先去掉已导出的帧，这些帧不用再解码，
+        # 中断后重新导出只处理剩下的帧
+        remaining = []
+        total = 0
+        for k, file_path in enumerate(file_paths):
+            file_indices = None if indices is None else indices[k]
+            timestamps = frame_timestamps(file_path, file_indices)
+            if file_indices is None:
+                file_indices = np.arange(len(timestamps))
+            exported = np.fromiter(
+                (f"{ts}{suffix}" in existing for ts in timestamps),
+                dtype=bool,
+                count=len(timestamps),
+            )
+            remaining.append(file_indices[~exported])
+            total += len(file_indices)
+        skipped = done = total - sum(len(i) for i in remaining)
+        indices = remaining
+
+        def on_done(future):
+            in_flight.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            for _, ts, data in stream_frames(file_paths, merge=True, indices=indices):
+                done += 1
+                if f"{ts}{suffix}" in existing:
+                    skipped += 1
+                else:
+                    in_flight.acquire()
+                    executor.submit(self._save, ts, data).add_done_callback(on_done)
+                    saved += 1
+                if progress is not None:
+                    progress(done, total)
+        if errors:
+            raise errors[0]
+        return saved, skipped
+
+    def _export_npy(self, file_paths, indices, total, progress):
+        """所有帧写进一个 .npy 数组（内存映射写入），时间戳另存为 *_ts.npy"""
+        if total is None:
+            raise ValueError("导出 npy 需要先用 select_frames 确定帧号")
+        stem = os.path.splitext(source_name(file_paths[0]))[0]
+        stack_path = os.path.join(self.output_folder, f"{stem}.npy")
+        stack = None
+        timestamps = np.empty(total, dtype=np.int64)
+        done = 0
+        for _, ts, data in stream_frames(file_paths, merge=True, indices=indices):
+            if stack is None:
+                stack = np.lib.format.open_memmap(
+                    stack_path, mode="w+", dtype=np.uint8, shape=(total, *data.shape)
+                )
+            stack[done] = data
+            timestamps[done] = ts
+            done += 1
+            if progress is not None:
+                progress(done, total)
+        if stack is None:
+            return 0, 0
+        stack.flush()
+        del stack
+        if done < total:
+            # 有帧损坏或时间戳无效而被跳过，数组长度与 _ts.npy 保持一致
+            _truncate_npy(stack_path, done)
+        np.save(os.path.join(self.output_folder, f"{stem}_ts.npy"), timestamps[:done])
+        return done, 0
+
+
+VIDEO_BACKENDS = ("auto", "ffmpeg", "opencv")
+
+
+def ffmpeg_available(ffmpeg="ffmpeg") -> bool:
+    return shutil.which(ffmpeg) is not None
+
+
+class OpenCVVideoSink:
+    """cv2.VideoWriter (mp4v)，灰度帧需要先转成 BGR"""
+
+    def __init__(self, video_path, fps, frame_shape):
+        height, width = frame_shape[:2]
+        self.writer = cv2.VideoWriter(
+            video_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+
+    def write(self, frame):
+        if frame.ndim == 2:  # 灰度图
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class FfmpegVideoSink:
+    """把原始帧通过管道交给本地 ffmpeg 编码。
+
+    灰度帧直接以 gray 像素格式送入，每像素 1 字节，不用先转成 BGR。
+    Args:
+        codec: "libx264" 或 "libx265"
+        preset: 编码速度预设，越快文件越大
+        crf: 质量参数，越小质量越高、文件越大
+        threads: ffmpeg 编码线程数，0 为自动
+        pix_fmt: 输出像素格式，"yuv420p" 兼容性最好，"gray" 更小但部分播放器不支持
+    """
+
+    def __init__(
+        self,
+        video_path,
+        fps,
+        frame_shape,
+        codec="libx264",
+        preset="veryfast",
+        crf=23,
+        threads=0,
+        pix_fmt="yuv420p",
+        ffmpeg="ffmpeg",
+    ):
+        height, width = frame_shape[:2]
+        in_pix_fmt = "gray" if len(frame_shape) == 2 else "bgr24"
+        command = [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", in_pix_fmt,
+            "-s", f"{width}x{height}", "-r", f"{fps:.6g}", "-i", "-",
+            "-c:v", codec, "-preset", preset, "-crf", str(crf),
+            "-threads", str(threads), "-pix_fmt", pix_fmt,
+        ]  # fmt: skip
+        if pix_fmt.startswith("yuv420") and (width % 2 or height % 2):
+            # yuv420p 要求宽高为偶数
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command.append(video_path)
+        # stderr 写到临时文件：管道没人读时 ffmpeg 输出太多会写满管道而卡住
+        self.stderr = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=self.stderr
+        )
+
+    def write(self, frame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self.process.wait()
+        self.stderr.seek(0)
+        stderr = self.stderr.read()
+        self.stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg 编码出错：{stderr.decode(errors='replace')}")
+
+
+def open_video_sink(video_path, fps, frame_shape, backend="auto", **options):
+    """打开视频输出。backend 为 "auto" 时有 ffmpeg 就用 ffmpeg，否则用 OpenCV。
+
+    options 传给 FfmpegVideoSink（codec、preset、crf、threads、pix_fmt），OpenCV 时忽略。
+    """
+    if backend not in VIDEO_BACKENDS:
+        raise ValueError(f"不支持的视频后端：{backend}")
+    if backend == "auto":
+        ffmpeg = options.get("ffmpeg", "ffmpeg")
+        backend = "ffmpeg" if ffmpeg_available(ffmpeg) else "opencv"
+    if backend == "ffmpeg":
+        return FfmpegVideoSink(video_path, fps, frame_shape, **options)
+    return OpenCVVideoSink(video_path, fps, frame_shape)
+
+
+def concat_videos(segment_paths, video_path, ffmpeg="ffmpeg"):
+    """用 ffmpeg concat 拼接视频片段，直接复制码流，不重新编码"""
+    list_path = video_path + ".concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment_path in segment_paths:
+            escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run(
+            [
+                ffmpeg, "-y", "-loglevel", "error",
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-c", "copy", video_path,
+            ],  # fmt: skip
+            capture_output=True,
+        )
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg 拼接出错：{result.stderr.decode(errors='replace')}")
+
+
+class SegmentedVideoExport:
+    """可中断、可增量的视频导出。
+
+    每个 .bin 文件编码为 <视频名>.segments/ 中的一个片段，完成后记入 manifest.json
+    （含源文件签名和导出参数）。再次导出时，源文件和参数都没变的片段直接复用，
+    只编码新增或变化的文件，最后用 ffmpeg 直接拼接片段，不重新编码。
+
+    Example:
+        export = SegmentedVideoExport(video_path, {"codec": "libx264"})
+        export.run(file_paths, fps)
+    """
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, video_path, options=None):
+        self.video_path = video_path
+        self.segment_folder = os.path.splitext(video_path)[0] + SEGMENT_SUFFIX
+        self.manifest_path = os.path.join(self.segment_folder, "manifest.json")
+        # 经过一次 JSON 往返，和从 manifest 读回的参数可以直接比较
+        self.options = json.loads(json.dumps(options or {}, default=str))
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if (
+            not manifest
+            or manifest.get("version") != self.MANIFEST_VERSION
+            or manifest.get("options") != self.options
+        ):
+            # 导出参数变了，之前的片段都不能用
+            manifest = {
+                "version": self.MANIFEST_VERSION,
+                "options": self.options,
+                "fps": None,
+                "segments": {},
+            }
+        return manifest
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    @property
+    def fps(self):
+        """之前导出时用的帧率，增量导出时沿用，保证片段可以直接拼接"""
+        return self.manifest["fps"]
+
+    def _segment_key(self, file_path) -> str:
+        return source_name(file_path)
+
+    def pending(self, file_paths) -> list[int]:
+        """需要（重新）编码的文件序号"""
+        pending = []
+        for file_index, file_path in enumerate(file_paths):
+            segment = self.manifest["segments"].get(self._segment_key(file_path))
+            if (
+                segment is None
+                or segment["signature"] != source_signature(file_path)
+                or not os.path.isfile(os.path.join(self.segment_folder, segment["file"]))
+            ):
+                pending.append(file_index)
+        return pending
+
+    def run(
+        self,
+        file_paths,
+        fps,
+        indices=None,
+        backend="ffmpeg",
+        progress=None,
+        **video_options,
+    ) -> dict:
+        """编码缺少的片段并拼接成完整视频。
+
+        Args:
+            file_paths: 按时间顺序排列的 .bin 文件
+            fps: 帧率（manifest 中已有帧率时以其为准）
+            indices: 每个文件要导出的帧号（见 select_frames），默认全部
+            progress: 回调 progress(done, total)，按帧计数，复用的片段算作已完成
+        Returns:
+            {"reused": 复用的片段数, "encoded": 新编码的片段数}
+        """
+        os.makedirs(self.segment_folder, exist_ok=True)
+        if self.fps is None:
+            self.manifest["fps"] = fps
+        stale = self.pending(file_paths)
+        n_reused = len(file_paths) - len(stale)
+        for i in stale:
+            self.manifest["segments"].pop(self._segment_key(file_paths[i]), None)
+        # 没有选中任何帧的文件不需要片段
+        pending = [i for i in stale if indices is None or len(indices[i])]
+        counts = [
+            len(frame_timestamps(path)) if indices is None else len(indices[i])
+            for i, path in enumerate(file_paths)
+        ]
+        total = sum(counts)
+        done = total - sum(counts[i] for i in pending)
+        pending_paths = [file_paths[i] for i in pending]
+        pending_indices = None if indices is None else [indices[i] for i in pending]
+
+        # 逐个文件按顺序解码，每个文件写一个片段；片段先写临时文件，写完再登记
+        sink = None
+        current = None
+        tmp_path = None
+
+        def finish_segment():
+            sink.close()
+            file_path = pending_paths[current]
+            segment_file = os.path.splitext(source_name(file_path))[0] + ".mp4"
+            os.replace(tmp_path, os.path.join(self.segment_folder, segment_file))
+            self.manifest["segments"][self._segment_key(file_path)] = {
+                "file": segment_file,
+                "signature": source_signature(file_path),
+            }
+            self._save_manifest()
+
+        for file_index, _, frame in stream_frames(
+            pending_paths, merge=False, indices=pending_indices
+        ):
+            if file_index != current:
+                if sink is not None:
+                    finish_segment()
+                current = file_index
+                tmp_path = os.path.join(self.segment_folder, f"segment-{file_index}.tmp.mp4")
+                sink = open_video_sink(
+                    tmp_path, self.fps, frame.shape, backend, **video_options
+                )
+            sink.write(frame)
+            done += 1
+            if progress is not None:
+                progress(done, total)
+        if sink is not None:
+            finish_segment()
+
+        segment_paths = []
+        for file_path in file_paths:
+            segment = self.manifest["segments"].get(self._segment_key(file_path))
+            if segment is not None:
+                segment_paths.append(os.path.join(self.segment_folder, segment["file"]))
+        if not segment_paths:
+            return {"reused": 0, "encoded": 0}
+        concat_videos(
+            segment_paths, self.video_path, video_options.get("ffmpeg", "ffmpeg")
+        )
+        return {"reused": n_reused, "encoded": len(pending)}
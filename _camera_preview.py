@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+
+from _camera_bin import CameraBinFile, frame_timeline, ts_per_second
+from _memo import LruCache
+
+
+class ThumbnailCache(LruCache):
+    """缩略图的 LRU 缓存，键为 (文件, 帧号, 宽度)，可在多个会话间共用"""
+
+    def __init__(self, max_items=4096):
+        super().__init__(max_items)
+
+
+def make_thumbnail(frame, width=160) -> np.ndarray:
+    """按宽度等比缩小（INTER_AREA 缩小时不会出现摩尔纹）"""
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def keyframes(file_paths, interval=5.0, max_frames=None) -> tuple:
+    """每隔 interval 秒取一帧（每段时间内的第一帧），只读索引，不解压。
+
+    Args:
+        max_frames: 帧数超过时均匀抽取，避免录像很长时缩略图过多
+    Returns:
+        (file_ids, frame_ids, timestamps)
+    """
+    file_ids, frame_ids, timestamps = frame_timeline(file_paths)
+    if len(timestamps) == 0:
+        return file_ids, frame_ids, timestamps
+    scale = ts_per_second(timestamps[0], file_paths[0])
+    buckets = (timestamps - timestamps[0]) // max(int(interval * scale), 1)
+    _, first = np.unique(buckets, return_index=True)
+    if max_frames is not None and len(first) > max_frames:
+        first = first[np.linspace(0, len(first) - 1, max_frames).round().astype(int)]
+    return file_ids[first], frame_ids[first], timestamps[first]
+
+
+def thumbnail_strip(
+    file_paths, interval=5.0, width=160, cache=None, max_frames=60
+) -> list[tuple]:
+    """稀疏关键帧的缩略图条，已缓存的缩略图不会再解码。
+
+    Returns:
+        [(ts, thumbnail), ...]，按时间排列
+    """
+    file_ids, frame_ids, timestamps = keyframes(file_paths, interval, max_frames)
+    thumbnails = [None] * len(timestamps)
+    missing = {}
+    for k, (file_index, frame_index) in enumerate(zip(file_ids, frame_ids)):
+        key = (file_paths[file_index], int(frame_index), width)
+        thumbnail = cache.get(key) if cache is not None else None
+        if thumbnail is None:
+            missing.setdefault(int(file_index), []).append(k)
+        else:
+            thumbnails[k] = thumbnail
+
+    # 每个文件只打开一次，缺少的关键帧批量解码
+    for file_index, positions in missing.items():
+        file_path = file_paths[file_index]
+        with CameraBinFile(file_path) as bin_file:
+            decoded_ts, frames = bin_file.read_frames(indices=frame_ids[positions])
+        for k, ts, frame in zip(positions, decoded_ts, frames):
+            if ts < 0:
+                continue
+            thumbnail = make_thumbnail(frame, width)
+            thumbnails[k] = thumbnail
+            if cache is not None:
+                cache.put((file_path, int(frame_ids[k]), width), thumbnail)
+
+    return [
+        (ts, thumbnail)
+        for ts, thumbnail in zip(timestamps, thumbnails)
+        if thumbnail is not None
+    ]
+
+
+def read_frame_near(file_paths, timeline, ts) -> tuple | None:
+    """随机访问：只解码时间戳不晚于 ts 的最后一帧。
+
+    Args:
+        timeline: frame_timeline(file_paths) 的结果
+    Returns:
+        (ts, ndarray)，解码出错时为 None
+    """
+    file_ids, frame_ids, timestamps = timeline
+    if len(timestamps) == 0:
+        return None
+    position = max(np.searchsorted(timestamps, ts, side="right") - 1, 0)
+    with CameraBinFile(file_paths[file_ids[position]]) as bin_file:
+        return bin_file.read_frame(int(frame_ids[position]))
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from _camera_bin import CameraBinFile, select_frames, source_name
+
+# 每个统计量是一个对整批帧 (N, H, W) 向量化计算的函数，返回 {列名: 长度为 N 的数组}
+
+
+def _mean(stack, **_) -> dict:
+    return {"mean": stack.mean(axis=(1, 2))}
+
+
+def _std(stack, **_) -> dict:
+    flat = stack.reshape(len(stack), -1)
+    n_pixels = flat.shape[1]
+    # 用整数累加平方和（uint16 足够放下 255²），临时数组只有整批帧的两倍大
+    total = flat.sum(axis=1, dtype=np.int64)
+    squares = np.square(flat, dtype=np.uint16).sum(axis=1, dtype=np.int64)
+    mean = total / n_pixels
+    return {"std": np.sqrt(np.maximum(squares / n_pixels - mean**2, 0))}
+
+
+def _max(stack, **_) -> dict:
+    return {"max": stack.max(axis=(1, 2))}
+
+
+def _saturation(stack, saturation_level=255, **_) -> dict:
+    """亮度达到 saturation_level 的像素比例"""
+    saturated = (stack >= saturation_level).sum(axis=(1, 2), dtype=np.int64)
+    return {"saturation": saturated / (stack.shape[1] * stack.shape[2])}
+
+
+def _centroid(stack, threshold=200, **_) -> dict:
+    """亮度不低于 threshold 的区域（熔区）的亮度加权质心，单位为像素；没有亮区时为 NaN"""
+    weights = stack * (stack >= threshold)
+    column_profile = weights.sum(axis=1, dtype=np.int64)  # (N, W)
+    row_profile = weights.sum(axis=2, dtype=np.int64)  # (N, H)
+    total = column_profile.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = column_profile @ np.arange(stack.shape[2]) / total
+        y = row_profile @ np.arange(stack.shape[1]) / total
+    return {
+        "centroid_x": x,
+        "centroid_y": y,
+        "bright_area": (stack >= threshold).sum(axis=(1, 2)),
+    }
+
+
+FRAME_STATISTICS = {
+    "mean": _mean,
+    "std": _std,
+    "max": _max,
+    "saturation": _saturation,
+    "centroid": _centroid,
+}
+
+
+def frame_stats(
+    file_paths,
+    stats=("mean",),
+    selection=None,
+    batch_size=64,
+    progress=None,
+    **params,
+) -> pd.DataFrame:
+    """逐批解码并计算每帧的统计量，内存中最多只有 batch_size 帧。
+
+    Args:
+        stats: FRAME_STATISTICS 中的统计量名称
+        selection: select_frames 的参数（时间窗口、帧范围、隔 N 帧），默认全部帧
+        batch_size: 每批解码的帧数
+        progress: 回调 progress(done, total)
+        params: 传给统计函数的参数，如 threshold（熔区亮度阈值）、saturation_level
+    Returns:
+        以时间戳 ts 为索引、按时间排序的 DataFrame，另有 file 列
+    """
+    unknown = set(stats) - set(FRAME_STATISTICS)
+    if unknown:
+        raise ValueError(f"未知的统计量：{', '.join(sorted(unknown))}")
+    indices = select_frames(file_paths, **(selection or {}))
+    total = sum(len(i) for i in indices)
+    parts = []
+    done = 0
+    for file_path, file_indices in zip(file_paths, indices):
+        if len(file_indices) == 0:
+            continue
+        with CameraBinFile(file_path) as bin_file:
+            buffer = np.empty((batch_size, *bin_file.frame_shape()), dtype=np.uint8)
+            for start in range(0, len(file_indices), batch_size):
+                batch = file_indices[start : start + batch_size]
+                timestamps, stack = bin_file.read_frames(batch, out=buffer[: len(batch)])
+                valid = timestamps >= 0
+                stack = stack[valid] if not valid.all() else stack
+                if stack.ndim == 4:  # 彩色帧取各通道最大值作为亮度
+                    stack = stack.max(axis=3)
+                columns = {"ts": timestamps[valid]}
+                for name in stats:
+                    columns.update(FRAME_STATISTICS[name](stack, **params))
+                part = pd.DataFrame(columns)
+                part["file"] = source_name(file_path)
+                parts.append(part)
+                done += len(batch)
+                if progress is not None:
+                    progress(done, total)
+
+    if not parts:
+        return pd.DataFrame(columns=["file"]).rename_axis("ts")
+    return pd.concat(parts, ignore_index=True).set_index("ts").sort_index()
@@ -0,0 +1,411 @@
+"""电机、光谱数据的列式存储。
+
+电机数据（DataFrame）转存为 Feather（不压缩，可内存映射、按列读取）或 Parquet；
+光谱数据转存为目录 <名称>.spectra/：
+    wavelengths.npy   所有行共用的波长轴
+    intensity.npy     (行数, 波长数) float32 强度矩阵，内存映射读取
+    table.feather     其余标量列（time_axis 等），没有 pyarrow 时为 table.pkl
+
+读取时如果 .pkl 旁边有不旧于它的转存文件就直接读转存文件，否则读 .pkl 并顺便转存；
+没有安装 pyarrow 时电机数据只用 .pkl。
+
+用法：
+    python _data_store.py LHPG-motor.pkl LHPG-spectra.pkl ...
+"""
+
+import os
+import sys
+import zlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow 是可选依赖
+    pyarrow = feather = None
+
+MOTOR_FORMATS = {"feather": ".feather", "parquet": ".parquet"}
+SPECTRA_SUFFIX = ".spectra"
+SPECTRA_ARRAY_COLUMNS = ("wavelengths", "intensitys")
+
+
+def _is_fresh(converted_path, source_path) -> bool:
+    """转存文件存在，且不比原 .pkl 旧（原文件不存在时也算）"""
+    if not os.path.exists(converted_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    return os.path.getmtime(converted_path) >= os.path.getmtime(source_path)
+
+
+def _stem(file_path) -> str:
+    return os.path.splitext(file_path)[0]
+
+
+def _write_table(df, file_path, file_format="feather"):
+    # 非默认的索引作为列保存，并记在 pandas 元数据中，读取时恢复为索引，
+    # 与直接读 .pkl 得到的 DataFrame 相同
+    tmp_path = file_path + ".tmp"
+    if file_format == "feather":
+        # 不压缩才能内存映射
+        table = pyarrow.Table.from_pandas(df)
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+    else:
+        df.to_parquet(tmp_path)
+    os.replace(tmp_path, file_path)
+
+
+def _read_table(file_path, columns=None) -> pd.DataFrame:
+    if file_path.endswith(".parquet"):
+        return pd.read_parquet(file_path, columns=columns, memory_map=True)
+    table = feather.read_table(file_path, memory_map=True)
+    if columns is not None:
+        # 索引列不在 columns 中，也要一起读出
+        metadata = table.schema.pandas_metadata or {}
+        index_columns = [
+            c for c in metadata.get("index_columns", []) if isinstance(c, str)
+        ]
+        table = table.select([*columns, *index_columns])
+    return table.to_pandas()
+
+
+def convert_motor(file_path, file_format="feather") -> str | None:
+    """把电机数据 .pkl 转存为 Feather/Parquet，返回新文件路径；没有 pyarrow 时返回 None"""
+    if feather is None:
+        print("未安装 pyarrow，电机数据保留为 .pkl")
+        return None
+    converted_path = _stem(file_path) + MOTOR_FORMATS[file_format]
+    _write_table(pd.read_pickle(file_path), converted_path, file_format)
+    return converted_path
+
+
+def load_motor(file_path, columns=None) -> pd.DataFrame:
+    """读取电机数据，只读 columns 中的列（默认全部）。
+
+    Args:
+        file_path: .pkl、.feather 或 .parquet 文件
+    """
+    if feather is not None:
+        if file_path.endswith(tuple(MOTOR_FORMATS.values())):
+            return _read_table(file_path, columns)
+        for suffix in MOTOR_FORMATS.values():
+            converted_path = _stem(file_path) + suffix
+            if _is_fresh(converted_path, file_path):
+                return _read_table(converted_path, columns)
+    df = pd.read_pickle(file_path)
+    if feather is not None:
+        try:
+            _write_table(df, _stem(file_path) + MOTOR_FORMATS["feather"])
+        except OSError as e:
+            print(f"转存 {file_path} 出错：{e}")
+    return df if columns is None else df[columns]
+
+
+class SpectraData:
+    """一次实验的全部光谱：共用的波长轴、(行数, 波长数) 强度矩阵和其余标量列。
+
+    支持 len、data["time_axis"]、data.iloc[...]（按行取子集），可以直接用于
+    get_intensity_by_wavelength。
+
+    Example:
+        data = load_spectra("LHPG-spectra.pkl")
+        data.intensity[:, data.wavelength_index(1550)]
+    """
+
+    def __init__(self, wavelengths, intensity, table):
+        if not _is_sorted(wavelengths):
+            # 波长轴按升序排列，之后可以二分查找
+            order = np.argsort(wavelengths, kind="stable")
+            wavelengths, intensity = wavelengths[order], intensity[:, order]
+        self.wavelengths = wavelengths
+        self.intensity = intensity
+        self.table = table
+        self.store_path = None  # 从 .spectra 目录打开时为目录路径
+
+    @classmethod
+    def from_frame(cls, df) -> "SpectraData":
+        """由旧格式 DataFrame（每行一个 wavelengths/intensitys 数组）生成。
+
+        各行波长轴按哈希分组比较；不一致时以行数最多的波长轴为准，其余各组
+        线性插值到这个波长轴上（超出范围的点为 NaN）。
+        """
+        if len(df) == 0:
+            return cls(np.empty(0), np.empty((0, 0), dtype=np.float32), df)
+        groups = _group_by_grid(df["wavelengths"].to_numpy())
+        grid, rows = max(groups, key=lambda group: len(group[1]))
+        order = None if _is_sorted(grid) else np.argsort(grid, kind="stable")
+        wavelengths = grid if order is None else grid[order]
+        intensity = np.empty((len(df), len(wavelengths)), dtype=np.float32)
+        all_intensity = df["intensitys"].to_numpy()
+        for group_grid, group_rows in groups:
+            if group_grid is grid:
+                # 逐行写入，转换时不额外生成整个矩阵大小的临时数组
+                for row in group_rows:
+                    values = all_intensity[row]
+                    intensity[row] = values if order is None else values[order]
+            else:
+                matrix = np.stack(all_intensity[group_rows], dtype=np.float32)
+                intensity[group_rows] = regrid(matrix, group_grid, wavelengths)
+        if len(groups) > 1:
+            print(
+                f"{len(df) - len(rows)} 行光谱的波长轴与其余行不同，已插值到共同的波长轴"
+            )
+        table = df.drop(columns=list(SPECTRA_ARRAY_COLUMNS)).reset_index(drop=True)
+        return cls(wavelengths, intensity, table)
+
+    def __len__(self):
+        return len(self.intensity)
+
+    def __getitem__(self, column):
+        return self.table[column]
+
+    @property
+    def columns(self):
+        return self.table.columns.append(pd.Index(SPECTRA_ARRAY_COLUMNS))
+
+    @property
+    def index(self):
+        return self.table.index
+
+    @property
+    def iloc(self):
+        return _SpectraRows(self)
+
+    def take(self, rows) -> "SpectraData":
+        """按行取子集；rows 为切片时强度矩阵是视图，不复制"""
+        table = self.table.iloc[rows]
+        return SpectraData(self.wavelengths, self.intensity[rows], table)
+
+    def wavelength_index(self, wavelength) -> int:
+        """最接近 wavelength 的波长序号"""
+        return int(self.wavelength_indices(wavelength)[0])
+
+    def wavelength_indices(self, wavelengths) -> np.ndarray:
+        """每个波长最接近的波长序号（波长轴已排序，二分查找）"""
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=np.float64))
+        axis = self.wavelengths
+        right = np.clip(np.searchsorted(axis, wavelengths), 1, max(len(axis) - 1, 1))
+        left = right - 1
+        closer_left = np.abs(wavelengths - axis[left]) <= np.abs(axis[right] - wavelengths)
+        return np.where(closer_left, left, right)
+
+    def extract(self, wavelengths, method="nearest", bandwidth=None) -> np.ndarray:
+        """一次取出多个波长处的强度，返回 (行数, 波长数) 数组。
+
+        Args:
+            wavelengths: 一个或多个波长 (nm)
+            method: "nearest" 取最近的波长点，"linear" 在相邻两个波长点间线性插值
+            bandwidth: 给出时改为积分 [λ - bandwidth/2, λ + bandwidth/2] 内的强度（梯形积分）
+        """
+        wavelengths = np.atleast_1d(np.asarray(wavelengths, dtype=np.float64))
+        if bandwidth:
+            result = np.empty((len(self), len(wavelengths)), dtype=np.float32)
+            for k, wavelength in enumerate(wavelengths):
+                result[:, k] = self._band_integral(
+                    wavelength - bandwidth / 2, wavelength + bandwidth / 2
+                )
+            return result
+        if method == "linear":
+            return self._interpolate(self.intensity, wavelengths)
+        if method != "nearest":
+            raise ValueError(f"未知的取值方式：{method}")
+        return np.asarray(self.intensity[:, self.wavelength_indices(wavelengths)])
+
+    def _interpolate(self, matrix, wavelengths) -> np.ndarray:
+        """沿波长轴线性插值（超出范围时取端点值），两次花式索引取出所有需要的列"""
+        axis = self.wavelengths
+        right = np.clip(np.searchsorted(axis, wavelengths), 1, len(axis) - 1)
+        left = right - 1
+        weight = np.clip(
+            (wavelengths - axis[left]) / (axis[right] - axis[left]), 0.0, 1.0
+        ).astype(np.float32)
+        return matrix[:, left] * (1 - weight) + matrix[:, right] * weight
+
+    def _band_integral(self, lower, upper) -> np.ndarray:
+        """每行在 [lower, upper] 内的梯形积分（超出波长轴的部分不计）。
+
+        只读取波段覆盖的那几列，强度矩阵为内存映射时不会整个读进内存；
+        波段与缺失区间（插值到共同波长轴时超出原范围的点，为 NaN）重叠时结果为 NaN。
+        """
+        axis = self.wavelengths
+        lower, upper = max(lower, axis[0]), min(upper, axis[-1])
+        if upper <= lower:
+            return np.zeros(len(self), dtype=np.float32)
+        start = np.searchsorted(axis, lower, side="right")
+        stop = np.searchsorted(axis, upper, side="left")
+        # 波段两端插值得到的点加上波段内的波长点
+        x = np.concatenate(([lower], axis[start:stop], [upper]))
+        y = np.column_stack(
+            (
+                self._intensity_at(lower),
+                self.intensity[:, start:stop],
+                self._intensity_at(upper),
+            )
+        )
+        steps = np.diff(x).astype(np.float32)
+        return ((y[:, 1:] + y[:, :-1]) * (steps / 2)).sum(axis=1)
+
+    def _intensity_at(self, wavelength) -> np.ndarray:
+        """wavelength 处的强度（线性插值）；正好落在波长点上时直接取这一列，
+        相邻的 NaN 不会乘 0 后混进来"""
+        axis = self.wavelengths
+        right = np.searchsorted(axis, wavelength, side="right")
+        right = min(max(right, 1), len(axis) - 1)
+        left = right - 1
+        if axis[left] == wavelength:
+            return self.intensity[:, left]
+        if axis[right] == wavelength:
+            return self.intensity[:, right]
+        weight = np.float32((wavelength - axis[left]) / (axis[right] - axis[left]))
+        return self.intensity[:, left] * (1 - weight) + self.intensity[:, right] * weight
+
+    def spectrum(self, row) -> np.ndarray:
+        return self.intensity[row]
+
+    def save(self, store_path):
+        """保存为 <名称>.spectra 目录"""
+        os.makedirs(store_path, exist_ok=True)
+        for f in os.listdir(store_path):
+            if f.startswith("lod_"):  # 旧数据的热图金字塔（见 LodPyramid）
+                os.remove(os.path.join(store_path, f))
+        np.save(os.path.join(store_path, "wavelengths.npy"), self.wavelengths)
+        if feather is not None:
+            _write_table(self.table, os.path.join(store_path, "table.feather"))
+        else:
+            self.table.to_pickle(os.path.join(store_path, "table.pkl"))
+        # intensity.npy 是判断转存是否最新的标志，其他文件都写完后最后写入，
+        # 中途出错时目录会被当作过期而重新转存
+        intensity_path = os.path.join(store_path, "intensity.npy")
+        with open(intensity_path + ".tmp", "wb") as f:
+            np.save(f, self.intensity)
+        os.replace(intensity_path + ".tmp", intensity_path)
+
+    @classmethod
+    def open(cls, store_path, columns=None) -> "SpectraData":
+        """打开 .spectra 目录，强度矩阵以内存映射方式读取"""
+        wavelengths = np.load(os.path.join(store_path, "wavelengths.npy"))
+        intensity = np.load(os.path.join(store_path, "intensity.npy"), mmap_mode="r")
+        table_path = os.path.join(store_path, "table.feather")
+        if feather is not None and os.path.exists(table_path):
+            table = _read_table(table_path, columns)
+        else:
+            table = pd.read_pickle(os.path.join(store_path, "table.pkl"))
+            if columns is not None:
+                table = table[columns]
+        data = cls(wavelengths, intensity, table)
+        data.store_path = store_path
+        return data
+
+
+def _is_sorted(values) -> bool:
+    return not np.any(np.diff(values) < 0)
+
+
+def _group_by_grid(grids) -> list[tuple]:
+    """按波长轴把行分组，返回 [(波长轴, 行号数组), ...]。
+
+    先比较长度和 CRC32，哈希相同时再逐个比较一次确认。
+    """
+    groups = {}
+    for row, grid in enumerate(grids):
+        grid = np.ascontiguousarray(grid, dtype=np.float64)
+        key = (len(grid), zlib.crc32(grid))
+        candidates = groups.setdefault(key, [])
+        for group_grid, group_rows in candidates:
+            if np.array_equal(group_grid, grid):
+                group_rows.append(row)
+                break
+        else:
+            candidates.append((grid, [row]))
+    return [
+        (grid, np.array(rows))
+        for candidates in groups.values()
+        for grid, rows in candidates
+    ]
+
+
+def regrid(matrix, from_wavelengths, to_wavelengths) -> np.ndarray:
+    """把每行定义在 from_wavelengths 上的光谱线性插值到 to_wavelengths（已排序）。
+
+    所有行共用同一组插值位置和权重，一次花式索引完成；超出原波长范围的点为 NaN。
+    """
+    axis = np.asarray(from_wavelengths, dtype=np.float64)
+    matrix = np.asarray(matrix)
+    if not _is_sorted(axis):
+        order = np.argsort(axis, kind="stable")
+        axis, matrix = axis[order], matrix[:, order]
+    right = np.clip(np.searchsorted(axis, to_wavelengths), 1, len(axis) - 1)
+    left = right - 1
+    weight = ((to_wavelengths - axis[left]) / (axis[right] - axis[left])).astype(
+        np.float32
+    )
+    result = matrix[:, left] * (1 - weight) + matrix[:, right] * weight
+    outside = (to_wavelengths < axis[0]) | (to_wavelengths > axis[-1])
+    result[:, outside] = np.nan
+    return result
+
+
+class _SpectraRows:
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, rows):
+        return self.data.take(rows)
+
+
+def convert_spectra(file_path) -> str:
+    """把光谱数据 .pkl 转存为 .spectra 目录，返回目录路径"""
+    store_path = _stem(file_path) + SPECTRA_SUFFIX
+    SpectraData.from_frame(pd.read_pickle(file_path)).save(store_path)
+    return store_path
+
+
+def load_spectra(file_path, columns=None) -> SpectraData:
+    """读取光谱数据。
+
+    Args:
+        file_path: .pkl 文件或 .spectra 目录
+        columns: 只读取的标量列（默认全部）
+    """
+    if file_path.endswith(SPECTRA_SUFFIX):
+        return SpectraData.open(file_path, columns)
+    store_path = _stem(file_path) + SPECTRA_SUFFIX
+    if _is_fresh(os.path.join(store_path, "intensity.npy"), file_path):
+        return SpectraData.open(store_path, columns)
+    data = SpectraData.from_frame(pd.read_pickle(file_path))
+    try:
+        data.save(store_path)
+    except OSError as e:
+        print(f"转存 {file_path} 出错：{e}")
+    else:
+        # 转存成功后改为内存映射读取，不在内存中留一份完整矩阵，
+        # store_path 也随之设置（热图金字塔可以缓存到目录中）
+        return SpectraData.open(store_path, columns)
+    if columns is not None:
+        data.table = data.table[columns]
+    return data
+
+
+def find_data_files(folder_path, kind) -> list[str]:
+    """文件夹中名称包含 kind（"motor" 或 "spectra"）的数据文件。
+
+    同名的 .pkl 和转存文件只列出一个（优先 .pkl），只剩转存文件时列出转存文件。
+    """
+    suffixes = (".pkl", *MOTOR_FORMATS.values(), SPECTRA_SUFFIX)
+    found = {}
+    for f in sorted(os.listdir(folder_path)):
+        stem, suffix = os.path.splitext(f)
+        if kind in f and suffix in suffixes:
+            if stem not in found or suffix == ".pkl":
+                found[stem] = f
+    return list(found.values())
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        if "spectra" in os.path.basename(path):
+            print(convert_spectra(path))
+        else:
+            print(convert_motor(path))
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+from _memo import LruCache, fingerprint
+
+# 绘图用的降采样：保留每段的极值，缩小显示时尖峰和直径缺陷不会丢失。
+#   m4:   每段取首、尾、最小、最大 4 个点（Jugel et al., M4）
+#   minmax: 每段取最小、最大 2 个点
+#   lttb: Largest-Triangle-Three-Buckets，每段取与前后两段构成三角形面积最大的点
+DOWNSAMPLE_METHODS = ("m4", "minmax", "lttb", "stride")
+
+_cache = LruCache(64)
+
+
+def _bucket_view(y, n_buckets, fill) -> np.ndarray:
+    """把 y 均匀分成 n_buckets 段，不足的部分用 fill 补齐，返回 (n_buckets, 段长) 数组"""
+    size = -(-len(y) // n_buckets)
+    padded = np.full(n_buckets * size, fill, dtype=np.float64)
+    padded[: len(y)] = y
+    return padded.reshape(n_buckets, size), size
+
+
+def _extrema_indices(y, n_buckets, with_ends) -> np.ndarray:
+    y = np.asarray(y, dtype=np.float64)
+    n_buckets = min(n_buckets, len(y))
+    # NaN 不参与比较：求最小值时当作 +inf，求最大值时当作 -inf
+    low, size = _bucket_view(np.where(np.isnan(y), np.inf, y), n_buckets, np.inf)
+    high, _ = _bucket_view(np.where(np.isnan(y), -np.inf, y), n_buckets, -np.inf)
+    offsets = np.arange(n_buckets) * size
+    indices = [offsets + low.argmin(axis=1), offsets + high.argmax(axis=1)]
+    if with_ends:
+        last = np.minimum(offsets + size, len(y)) - 1
+        indices += [offsets, last]
+    indices = np.concatenate(indices)
+    return np.unique(indices[indices < len(y)])
+
+
+def m4_indices(y, n_out) -> np.ndarray:
+    """M4：每段的首、尾、最小、最大值，最多 n_out 个点"""
+    return _extrema_indices(y, max(n_out // 4, 1), with_ends=True)
+
+
+def minmax_indices(y, n_out) -> np.ndarray:
+    """每段的最小、最大值，最多 n_out 个点"""
+    return _extrema_indices(y, max(n_out // 2, 1), with_ends=False)
+
+
+def lttb_indices(x, y, n_out) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets，返回 n_out 个点（含首尾两点）的下标"""
+    y = np.asarray(y, dtype=np.float64)
+    x = np.arange(len(y), dtype=np.float64) if x is None else np.asarray(x, np.float64)
+    if n_out >= len(y):
+        return np.arange(len(y))
+    if n_out < 3:
+        # 分不出中间的段，只保留首点或首尾两点
+        return np.linspace(0, len(y) - 1, n_out).astype(np.int64)
+    # 中间 n_out - 2 段，首尾两点固定保留
+    edges = np.linspace(1, len(y) - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, len(y) - 1
+    # 每段的均值点，作为下一段的参考点
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1])[: len(counts)] / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1])[: len(counts)] / counts
+    previous = 0
+    for k in range(n_out - 2):
+        start, end = edges[k], edges[k + 1]
+        if k + 1 < len(counts):
+            next_x, next_y = mean_x[k + 1], mean_y[k + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # 三角形面积（省去常数 1/2），整段一次向量化计算
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.nanargmax(area)) if np.any(area == area) else start
+        indices[k + 1] = previous
+    return indices
+
+
+def downsample_indices(y, n_out, method="m4", x=None) -> np.ndarray:
+    """返回保留点的下标（升序），结果会缓存，同样的数据再次调用时不用重新计算"""
+    if len(y) <= n_out:
+        return np.arange(len(y))
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"未知的降采样方法：{method}")
+    key = (method, n_out, fingerprint(y), fingerprint(x) if method == "lttb" else None)
+
+    def compute():
+        if method == "m4":
+            return m4_indices(y, n_out)
+        if method == "minmax":
+            return minmax_indices(y, n_out)
+        if method == "lttb":
+            return lttb_indices(x, y, n_out)
+        return np.arange(0, len(y), -(-len(y) // n_out))
+
+    return _cache.get_or_compute(key, compute)
+
+
+def downsample(data, max_points=20000, method="m4", columns=None, x=None):
+    """绘图用降采样，结果不超过 max_points 个点。
+
+    Args:
+        data: DataFrame、Series 或一维数组
+        columns: DataFrame 中要保留极值的列（默认全部数值列，不含 time_axis 这类单调递增的
+            横轴列），max_points 在各列间平分，保留各列选出的行的并集
+        x: LTTB 使用的横轴列名（DataFrame）或数组，默认按下标等间距
+    Returns:
+        与 data 同类型的子集
+    """
+    if len(data) <= max_points:
+        return data
+    if isinstance(data, pd.DataFrame):
+        if columns is None:
+            # 单调的列（时间轴等）怎么取点都不会丢失形状，不必分走点数
+            columns = [
+                c
+                for c in data.columns
+                if pd.api.types.is_numeric_dtype(data[c])
+                and not data[c].is_monotonic_increasing
+            ]
+        elif isinstance(columns, str):
+            columns = [columns]
+        columns = [c for c in columns if c != x] or list(data.columns[:1])
+        x_values = data[x].to_numpy() if isinstance(x, str) else x
+        n_out = max(max_points // len(columns), 1)
+        indices = np.unique(
+            np.concatenate(
+                [
+                    downsample_indices(data[c].to_numpy(), n_out, method, x_values)
+                    for c in columns
+                ]
+            )
+        )
+        return data.iloc[indices]
+    values = data.to_numpy() if isinstance(data, pd.Series) else np.asarray(data)
+    indices = downsample_indices(values, max_points, method, x)
+    return data.iloc[indices] if isinstance(data, pd.Series) else values[indices]
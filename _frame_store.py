@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import zstd
+
+from _memo import LruCache
+
+# 帧数组目录格式（类似 Zarr 的目录存储）：
+#   <name>.frames/
+#     meta.json        形状、dtype、每块帧数、压缩参数
+#     timestamps.npy   每帧时间戳，可直接内存映射
+#     chunks/<k>.zst   第 k 块 (chunk_frames, H, W) 的 zstd 压缩数据
+STORE_SUFFIX = ".frames"
+STORE_VERSION = 1
+
+
+def _chunk_path(store_path, k) -> str:
+    return os.path.join(store_path, "chunks", f"{k:06d}.zst")
+
+
+class FrameStoreWriter:
+    """流式写入帧数组目录，每凑满一块就交给线程池压缩写盘。
+
+    Example:
+        with FrameStoreWriter(path, (480, 640)) as writer:
+            for ts, frame in frames:
+                writer.append(ts, frame)
+    """
+
+    def __init__(
+        self,
+        store_path,
+        frame_shape,
+        chunk_frames=64,
+        level=3,
+        max_workers=None,
+        max_in_flight=None,
+    ):
+        self.store_path = store_path
+        self.frame_shape = tuple(frame_shape)
+        self.chunk_frames = chunk_frames
+        self.level = level
+        os.makedirs(os.path.join(store_path, "chunks"), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers)
+        self._in_flight = threading.BoundedSemaphore(
+            max_in_flight or (os.cpu_count() or 1) * 2
+        )
+        self._futures = []
+        self._buffer = np.empty((chunk_frames, *self.frame_shape), dtype=np.uint8)
+        self._n_buffered = 0
+        self._n_chunks = 0
+        self._timestamps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._executor.shutdown(cancel_futures=True)
+
+    def append(self, ts, frame):
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"帧尺寸 {frame.shape} 与数组 {self.frame_shape} 不一致")
+        self._buffer[self._n_buffered] = frame
+        self._timestamps.append(ts)
+        self._n_buffered += 1
+        if self._n_buffered == self.chunk_frames:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        if self._n_buffered == 0:
+            return
+        data = self._buffer[: self._n_buffered].tobytes()
+        self._in_flight.acquire()
+        future = self._executor.submit(
+            self._write_chunk, _chunk_path(self.store_path, self._n_chunks), data
+        )
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._futures.append(future)
+        self._n_chunks += 1
+        self._n_buffered = 0
+
+    def _write_chunk(self, chunk_path, data):
+        with open(chunk_path, "wb") as f:
+            f.write(zstd.compress(data, self.level))
+
+    def close(self):
+        self._flush_chunk()
+        self._executor.shutdown()
+        for future in self._futures:
+            future.result()
+        np.save(
+            os.path.join(self.store_path, "timestamps.npy"),
+            np.asarray(self._timestamps, dtype=np.int64),
+        )
+        meta = {
+            "version": STORE_VERSION,
+            "shape": [len(self._timestamps), *self.frame_shape],
+            "dtype": "uint8",
+            "chunk_frames": self.chunk_frames,
+            "compressor": "zstd",
+            "level": self.level,
+        }
+        with open(os.path.join(self.store_path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+
+class FrameStore:
+    """按块懒加载的帧数组，支持 len、整数/切片/数组下标和按时间戳切片。
+
+    只解压用到的块，最近用过的 cache_chunks 块保留在内存中。
+
+    Example:
+        store = FrameStore("LHPG-1730122064.frames")
+        frames = store[100:200]          # (100, H, W)
+        frames = store.time_slice(t0, t1)
+    """
+
+    def __init__(self, store_path, cache_chunks=8):
+        self.store_path = store_path
+        with open(os.path.join(store_path, "meta.json")) as f:
+            meta = json.load(f)
+        self.shape = tuple(meta["shape"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.chunk_frames = meta["chunk_frames"]
+        self.timestamps = np.load(
+            os.path.join(store_path, "timestamps.npy"), mmap_mode="r"
+        )
+        self.cache_chunks = cache_chunks
+        self._cache = LruCache(cache_chunks)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunk(self, k) -> np.ndarray:
+        """第 k 块 (chunk_frames, H, W)，最后一块可能不满"""
+        return self._cache.get_or_compute(k, lambda: self._read_chunk(k))
+
+    def _read_chunk(self, k) -> np.ndarray:
+        with open(_chunk_path(self.store_path, k), "rb") as f:
+            data = zstd.decompress(f.read())
+        return np.frombuffer(data, dtype=self.dtype).reshape(-1, *self.shape[1:])
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            # 只按第一维取帧，其余维度交给 numpy
+            frames = self[key[0]]
+            if np.isscalar(key[0]):
+                return frames[key[1:]]
+            return frames[(slice(None), *key[1:])]
+        if np.isscalar(key):
+            i = int(key) + len(self) if key < 0 else int(key)
+            if not 0 <= i < len(self):
+                raise IndexError(f"帧号 {key} 超出范围")
+            return self.chunk(i // self.chunk_frames)[i % self.chunk_frames]
+        indices = np.arange(len(self))[key]
+        out = np.empty((len(indices), *self.shape[1:]), dtype=self.dtype)
+        for k in np.unique(indices // self.chunk_frames):
+            in_chunk = indices // self.chunk_frames == k
+            out[in_chunk] = self.chunk(k)[indices[in_chunk] % self.chunk_frames]
+        return out
+
+    def time_slice(self, start_ts=None, end_ts=None) -> np.ndarray:
+        """时间戳在 [start_ts, end_ts] 内的帧（时间戳按写入顺序递增）"""
+        start = 0 if start_ts is None else np.searchsorted(self.timestamps, start_ts)
+        end = (
+            len(self)
+            if end_ts is None
+            else np.searchsorted(self.timestamps, end_ts, side="right")
+        )
+        return self[start:end]
@@ -0,0 +1,277 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import streamlit as st
+
+# 子进程上报进度的最小间隔（秒），同时也是检查取消标志的间隔
+PROGRESS_INTERVAL = 0.2
+
+JOB_STATUS_TEXT = {
+    "queued": "排队中",
+    "running": "进行中",
+    "done": "已完成",
+    "failed": "出错",
+    "cancelled": "已取消",
+}
+
+
+class JobCancelled(Exception):
+    """任务在子进程中被取消"""
+
+
+class Job:
+    """一个后台任务的状态，由 JobManager 更新，页面只读取"""
+
+    def __init__(self, job_id, title, key):
+        self.id = job_id
+        self.title = title
+        self.key = key
+        self.status = "queued"
+        self.done = 0
+        self.total = None
+        self.unit = "帧"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_event = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def throughput(self) -> float:
+        """每秒处理的帧（或文件）数"""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """预计剩余秒数，总量未知时为 None"""
+        if not self.total or not self.throughput:
+            return None
+        return max(self.total - self.done, 0) / self.throughput
+
+    @property
+    def fraction(self) -> float:
+        if self.status == "done":
+            return 1.0
+        if not self.total:
+            return 0.0
+        return min(self.done / self.total, 1.0)
+
+
+def _run_job(job_id, func, args, kwargs, progress_queue, cancel_event):
+    """在子进程中运行任务，把 progress(done, total, unit) 回调转成进度消息"""
+    last_report = 0.0
+
+    def progress(done, total=None, unit=None):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report < PROGRESS_INTERVAL and done != total:
+            return
+        last_report = now
+        if cancel_event.is_set():
+            raise JobCancelled()
+        progress_queue.put((job_id, done, total, unit))
+
+    if cancel_event.is_set():
+        raise JobCancelled()
+    progress_queue.put((job_id, 0, None, None))
+    return func(*args, progress=progress, **kwargs)
+
+
+class JobManager:
+    """进程级的后台任务管理器，所有会话共用（见 get_job_manager）。
+
+    任务在子进程中运行，页面重新运行不会中断或重复任务。任务函数需要能被
+    pickle（模块顶层函数），并接受关键字参数 progress(done, total, unit)。
+    参数相同的任务正在排队或运行时，submit 直接返回已有的任务。
+
+    Example:
+        job = get_job_manager().submit("导出图片", export_images_job, paths, folder)
+        job.status, job.done, job.total, job.eta
+    """
+
+    def __init__(self, max_workers=2, keep_finished=20):
+        self.max_workers = max_workers
+        self.keep_finished = keep_finished
+        self._ids = itertools.count(1)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # Streamlit 进程中有很多线程，fork 出的子进程可能继承被占用的锁而卡死，
+        # 子进程一律用 spawn 启动
+        self._mp_context = multiprocessing.get_context("spawn")
+        self._sync = self._mp_context.Manager()
+        self._progress_queue = self._sync.Queue()
+        self._executor = self._new_executor()
+        self._monitor = threading.Thread(target=self._watch_progress, daemon=True)
+        self._monitor.start()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.max_workers, mp_context=self._mp_context)
+
+    @staticmethod
+    def _job_key(func, args, kwargs) -> str:
+        return repr((func.__module__, func.__qualname__, args, sorted(kwargs.items())))
+
+    def submit(self, title, func, *args, **kwargs) -> Job:
+        key = self._job_key(func, args, kwargs)
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == key and job.active:
+                    return job
+            job = Job(next(self._ids), title, key)
+            job.cancel_event = self._sync.Event()
+            self._jobs[job.id] = job
+            self._forget_finished()
+        job_args = (job.id, func, args, kwargs, self._progress_queue, job.cancel_event)
+        executor = self._executor
+        try:
+            job.future = executor.submit(_run_job, *job_args)
+        except BrokenProcessPool:
+            # 某个子进程异常退出（如内存不足被杀）后进程池不能再用，换一个新的；
+            # 原进程池中的任务已经以出错结束
+            with self._lock:
+                if self._executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._new_executor()
+            job.future = self._executor.submit(_run_job, *job_args)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None or not job.active:
+            return
+        job.cancel_event.set()
+        if job.future.cancel():
+            # 还没开始运行的任务直接取消
+            job.status = "cancelled"
+            job.finished = time.time()
+
+    def jobs(self) -> list[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def clear_finished(self):
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if not j.active]:
+                del self._jobs[job_id]
+
+    def _forget_finished(self):
+        finished = [j.id for j in self._jobs.values() if not j.active]
+        for job_id in finished[: max(len(finished) - self.keep_finished, 0)]:
+            del self._jobs[job_id]
+
+    def _finish(self, job, future):
+        job.finished = time.time()
+        if future.cancelled():
+            job.status = "cancelled"
+            return
+        error = future.exception()
+        if isinstance(error, JobCancelled):
+            job.status = "cancelled"
+        elif error is not None:
+            job.status = "failed"
+            job.error = f"{type(error).__name__}: {error}"
+        else:
+            job.status = "done"
+            job.result = future.result()
+            if job.total:
+                job.done = job.total
+
+    def _watch_progress(self):
+        while True:
+            try:
+                job_id, done, total, unit = self._progress_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return  # Manager 已关闭
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                continue
+            if job.status == "queued":
+                job.status = "running"
+                job.started = time.time()
+            job.done = done
+            if total is not None:
+                job.total = total
+            if unit is not None:
+                job.unit = unit
+
+    def shutdown(self):
+        for job in self.jobs():
+            if job.active:
+                job.cancel_event.set()
+        self._executor.shutdown(cancel_futures=True)
+        self._sync.shutdown()
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """整个 Streamlit 进程共用一个任务管理器"""
+    return JobManager()
+
+
+def _format_seconds(seconds) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} 分 {seconds} 秒" if minutes else f"{seconds} 秒"
+
+
+@st.fragment(run_every=1.0)
+def show_jobs(compact=False):
+    """显示后台任务的进度，每秒刷新一次（只重新运行这一部分）。
+
+    Args:
+        compact: 只显示进度条（用于侧边栏）
+    """
+    manager = get_job_manager()
+    jobs = manager.jobs()
+    if not jobs:
+        if not compact:
+            st.caption("没有后台任务。")
+        return
+    for job in reversed(jobs):
+        status = JOB_STATUS_TEXT[job.status]
+        if compact:
+            st.progress(job.fraction, text=f"{job.title}：{status}")
+            continue
+        text = f"**{job.title}** — {status}"
+        if job.status == "running":
+            text += f"，{job.done}/{job.total or '?'} {job.unit}"
+            if job.throughput:
+                text += f"，{job.throughput:.1f} {job.unit}/秒"
+            if job.eta is not None:
+                text += f"，预计还需 {_format_seconds(job.eta)}"
+        elif not job.active:
+            text += f"，用时 {_format_seconds(job.elapsed)}"
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            st.progress(job.fraction, text=text)
+            if job.status == "done" and job.result:
+                st.caption(job.result)
+            elif job.status == "failed":
+                st.error(job.error)
+        with col2:
+            if job.active and st.button("取消", key=f"cancel_job_{job.id}"):
+                manager.cancel(job.id)
+    if not compact and any(not job.active for job in jobs):
+        if st.button("清除已结束的任务"):
+            manager.clear_finished()
@@ -1,16 +1,16 @@
 import os
-import shutil
-import tempfile
-import zipfile
-from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 from diegoplot import diegoplot
 
+from _camera_bin import zip_members
+from _data_store import find_data_files
+from _jobs import show_jobs
+from _motor_dataset import get_motor_dataset
+from _spectra_dataset import get_spectra_data
 from _tool_functions import (
-    auto_fft,
     convert_to_video,
     downsample_data,
     get_intensity_by_wavelength,
@@ -38,10 +38,11 @@ if folder_path:
         for file in os.listdir(folder_path):
             if file.endswith(".zip"):
                 st.session_state["camera_file"] = os.path.join(folder_path, file)
-            elif file.endswith(".pkl") and "motor" in file:
-                st.session_state["motor_file"] = os.path.join(folder_path, file)
-            elif file.endswith(".pkl") and "spectra" in file:
-                st.session_state["spectra_file"] = os.path.join(folder_path, file)
+        # 电机、光谱数据可以是 .pkl，也可以是转存后的 Feather/Parquet、.spectra 目录
+        for kind in ("motor", "spectra"):
+            found = find_data_files(folder_path, kind)
+            if found:
+                st.session_state[f"{kind}_file"] = os.path.join(folder_path, found[0])
         if (
             st.session_state["camera_file"]
             and st.session_state["motor_file"]
@@ -55,43 +56,30 @@ tab_camera, tab_motor, tab_spectra = st.tabs(["📸相机文件", "⚙️电机
 with tab_camera:
     if st.session_state["camera_file"]:
         if st.button("生成视频"):
-            # 解压缩
-            try:
-                temp_dir = tempfile.mkdtemp()
-                with st.spinner("正在解压缩文件..."):
-                    with zipfile.ZipFile(
-                        st.session_state["camera_file"], "r"
-                    ) as zip_file:
-                        camera_file_list = zip_file.namelist()
-
-                        def extract_file(file_name):
-                            zip_file.extract(file_name, temp_dir)
-
-                        with ThreadPoolExecutor(max_workers=6) as executor:
-                            executor.map(extract_file, camera_file_list)
-
-                # 转视频
-                camera_file_list = os.listdir(temp_dir)
-                convert_to_video(
-                    camera_file_list,
-                    st.session_state["folder_path"],
-                    file_folder_path=temp_dir,
-                )
-                st.success("视频生成完成！")
-            finally:
-                shutil.rmtree(temp_dir)
+            # 直接从压缩包中读取 .bin 文件，不解压到临时文件夹
+            camera_file_list = [
+                member.name
+                for member in zip_members(st.session_state["camera_file"])
+            ]
+            convert_to_video(
+                camera_file_list,
+                st.session_state["folder_path"],
+                file_folder_path=st.session_state["camera_file"],
+            )
+        show_jobs()
 
 # 电机处理
 with tab_motor:
     if st.session_state["motor_file"]:
-        motor_df = pd.read_pickle(st.session_state["motor_file"])
-        pull_speed = motor_df["motor1"].mode()[0]
+        motor_data = get_motor_dataset(st.session_state["motor_file"])
+        motor_df = motor_data.df
+        pull_speed = motor_data.pull_speed
         st.markdown(f"本次拉制速度：***{pull_speed:.2f} mm/min***, 选择需要的列：")
         column_name = st.selectbox(
             "选择需要的列", motor_df.columns, index=1, label_visibility="collapsed"
         )
 
-        motor_df_resampled = downsample_data(motor_df)
+        motor_df_resampled = motor_data.sampled(column_name)
         fig = px.line(
             motor_df_resampled,
             x=motor_df_resampled.index,
@@ -119,17 +107,19 @@ with tab_motor:
             use_length = st.checkbox("横轴使用长度", value=True)
         if st.button("生成图表"):
             dp_motor = diegoplot.DiegoPlot()
-            motor_fig_x = motor_df["time_axis"].iloc[x_start:x_end]
-            if use_length:
-                motor_fig_x = motor_fig_x * pull_speed
-            if start_at_zero:
-                motor_fig_x -= motor_fig_x.iloc[0]
+            motor_fig_x = motor_data.x_axis(
+                slice(x_start, x_end), use_length, start_at_zero
+            )
             dp_motor.ax.plot(motor_fig_x, motor_df[column_name].iloc[x_start:x_end])
             dp_motor.plot_label([motor_x_label, motor_y_label])
             dp_motor.fig.tight_layout()
             st.pyplot(dp_motor.fig)
         # fft
-        df_fft = auto_fft(motor_df["time_axis"] * 60, motor_df[column_name], 1)
+        df_fft = downsample_data(
+            motor_data.spectrum(column_name, cut_off=1),
+            30000,
+            columns="y_fft",
+        )
         fig_fft = px.line(
             df_fft,
             x="x_fft",
@@ -142,19 +132,20 @@ with tab_motor:
 # 光谱处理
 with tab_spectra:
     if st.session_state["spectra_file"]:
-        spectra_df = pd.read_pickle(st.session_state["spectra_file"])
-        spectra_df_resampled = downsample_data(spectra_df)
+        spectra_df = get_spectra_data(st.session_state["spectra_file"])
 
         wavelength = st.number_input(
             "选择波长", value=1550.0, min_value=0.0, max_value=4000.0
         )
         smooth = st.checkbox("平滑光谱", value=False)
-        intensity = get_intensity_by_wavelength(
-            spectra_df_resampled, wavelength, smooth, to_db=False
+        # 先取出整条强度曲线，再降采样（保留尖峰）
+        intensity = downsample_data(
+            pd.Series(
+                get_intensity_by_wavelength(spectra_df, wavelength, smooth, to_db=False)
+            )
         )
         fig = px.line(
-            spectra_df_resampled,
-            x=spectra_df_resampled.index,
+            x=intensity.index,
             y=intensity,
             labels={"x": "Time (min)", "y": "Intensity (a.u.)"},
             title="光谱数据预览",
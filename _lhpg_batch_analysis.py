@@ -0,0 +1,78 @@
+import os
+
+import plotly.express as px
+import streamlit as st
+
+from _batch_analysis import batch_analysis_job, find_runs, find_summary, load_summary
+from _jobs import get_job_manager, show_jobs
+
+# 设置页面标题
+st.markdown("#### → 📊多次实验批量分析")
+st.text("选择一个包含多个实验文件夹的根目录，批量计算拉制速度、直径统计、频谱峰和损耗。")
+
+
+@st.cache_data
+def load_summary_table(summary_path, mtime):
+    # mtime 只用于在重新分析后刷新缓存
+    return load_summary(summary_path)
+
+
+# 输入根目录
+root = st.text_input("请输入根目录路径：").strip("\"'")
+
+if root:
+    if not os.path.isdir(root):
+        st.write("输入的文件夹路径无效，请重新输入。")
+    else:
+        runs = find_runs(root)
+        st.write(f"找到 {len(runs)} 次实验（含有电机或光谱数据的文件夹）。")
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            wavelength_text = st.text_input("损耗波长 (nm)", value="1550")
+        with col2:
+            cut_off = st.number_input("频谱截断频率 (Hz)", min_value=0.01, value=1.0)
+        with col3:
+            n_peaks = st.number_input("频谱峰数", min_value=1, value=3, step=1)
+        with col4:
+            max_workers = st.number_input(
+                "进程数", min_value=1, value=os.cpu_count() or 1, step=1
+            )
+        try:
+            wavelengths = tuple(
+                float(w)
+                for w in wavelength_text.replace("，", ",").split(",")
+                if w.strip()
+            )
+        except ValueError:
+            st.error("波长格式错误，请输入数字，多个波长用逗号分隔。")
+            wavelengths = None
+
+        if st.button("开始批量分析", disabled=not runs or wavelengths is None):
+            # 已分析过且输入文件未改动的实验直接复用结果
+            get_job_manager().submit(
+                "批量分析",
+                batch_analysis_job,
+                root,
+                wavelengths=wavelengths,
+                cut_off=cut_off,
+                n_peaks=n_peaks,
+                max_workers=max_workers,
+            )
+        show_jobs()
+
+        summary_path = find_summary(root)
+        if summary_path:
+            summary = load_summary_table(summary_path, os.path.getmtime(summary_path))
+            if len(summary):
+                st.markdown("**汇总表**")
+                st.dataframe(summary)
+                numeric_columns = [
+                    c
+                    for c in summary.columns
+                    if summary[c].dtype.kind in "fi" and c != "cached"
+                ]
+                if numeric_columns:
+                    column = st.selectbox("对比的列", numeric_columns)
+                    fig = px.bar(summary, x="run", y=column, title=f"各次实验的 {column}")
+                    st.plotly_chart(fig)
@@ -1,6 +1,20 @@
 import streamlit as st
 import os
-from _tool_functions import file_list_to_df, convert_to_images, convert_to_video
+from _camera_bin import frame_timeline, recording_summary, ts_per_second
+from _camera_preview import ThumbnailCache, read_frame_near, thumbnail_strip
+from _jobs import show_jobs
+from _tool_functions import (
+    convert_to_frame_store,
+    convert_to_images,
+    convert_to_video,
+    file_list_to_df,
+)
+
+
+@st.cache_resource
+def get_thumbnail_cache() -> ThumbnailCache:
+    """缩略图缓存在所有会话间共用"""
+    return ThumbnailCache()
 
 
 st.markdown("#### → 📸相机数据处理模块")
@@ -24,7 +38,7 @@ if folder_path:
             st.write("该文件夹中没有找到 .bin 文件。")
         else:
             st.write("找到以下 .bin 文件：")
-            st.session_state.df = file_list_to_df(bin_files)
+            st.session_state.df = file_list_to_df(bin_files, folder_path)
             event = st.dataframe(
                 st.session_state.df, on_select="rerun", selection_mode="multi-row"
             )
@@ -40,17 +54,172 @@ if folder_path:
             if selected_files:
                 st.write(f"您选择了 {len(selected_files)} 个文件")
 
-            # 添加转图片和转视频按钮
-            col1, col2 = st.columns(2)
+            # 预览：稀疏关键帧缩略图 + 拖动滑块随机读取单帧，不用先导出视频
+            if selected_files and st.checkbox("预览录像"):
+                preview_paths = [os.path.join(folder_path, f) for f in selected_files]
+                prev_col1, prev_col2 = st.columns(2)
+                with prev_col1:
+                    preview_interval = st.number_input(
+                        "缩略图间隔 (秒)", min_value=0.1, value=5.0, step=1.0
+                    )
+                with prev_col2:
+                    preview_width = st.select_slider(
+                        "缩略图宽度", options=[80, 120, 160, 240], value=120
+                    )
+                with st.spinner("正在生成缩略图..."):
+                    strip = thumbnail_strip(
+                        preview_paths,
+                        preview_interval,
+                        preview_width,
+                        cache=get_thumbnail_cache(),
+                    )
+                    timeline = frame_timeline(preview_paths)
+                if not strip:
+                    st.write("所选文件中没有有效的帧。")
+                else:
+                    first_ts = timeline[2][0]
+                    scale = ts_per_second(first_ts, preview_paths[0])
+                    st.image(
+                        [thumbnail for _, thumbnail in strip],
+                        caption=[f"{(ts - first_ts) / scale:.1f} s" for ts, _ in strip],
+                    )
+                    duration = (timeline[2][-1] - first_ts) / scale
+                    preview_sec = st.slider(
+                        "预览位置 (秒)",
+                        min_value=0.0,
+                        max_value=max(float(duration), 0.1),
+                        value=0.0,
+                        step=0.1,
+                    )
+                    frame = read_frame_near(
+                        preview_paths, timeline, first_ts + int(preview_sec * scale)
+                    )
+                    if frame is not None:
+                        frame_ts, frame_data = frame
+                        st.image(
+                            frame_data,
+                            caption=f"{(frame_ts - first_ts) / scale:.3f} s（时间戳 {frame_ts}）",
+                        )
+
+            # 只导出部分帧：按时间范围或帧范围，并可每隔 N 帧取一帧
+            selection = None
+            if selected_files and st.checkbox("只导出部分帧"):
+                with st.spinner("正在读取帧索引..."):
+                    summary = recording_summary(
+                        [os.path.join(folder_path, f) for f in selected_files]
+                    )
+                if summary["n_frames"] == 0:
+                    st.write("所选文件中没有有效的帧。")
+                else:
+                    scale = summary["ts_per_second"]
+                    duration = (summary["last_ts"] - summary["first_ts"]) / scale
+                    st.write(
+                        f"共 {summary['n_frames']} 帧，时长 {duration:.1f} 秒。"
+                    )
+                    select_mode = st.radio(
+                        "选择方式", ["时间范围", "帧范围"], horizontal=True
+                    )
+                    if select_mode == "时间范围":
+                        start_sec, end_sec = st.slider(
+                            "时间范围 (秒)",
+                            min_value=0.0,
+                            max_value=max(float(duration), 0.1),
+                            value=(0.0, max(float(duration), 0.1)),
+                            step=0.1,
+                        )
+                        selection = {
+                            "start_ts": summary["first_ts"] + int(start_sec * scale),
+                            "end_ts": summary["first_ts"] + int(end_sec * scale),
+                        }
+                    else:
+                        start_frame, end_frame = st.slider(
+                            "帧范围",
+                            min_value=0,
+                            max_value=summary["n_frames"],
+                            value=(0, summary["n_frames"]),
+                        )
+                        selection = {"start_frame": start_frame, "end_frame": end_frame}
+                    selection["stride"] = st.number_input(
+                        "每 N 帧取一帧", min_value=1, value=1, step=1
+                    )
+
+            with st.expander("图片导出设置"):
+                img_col1, img_col2, img_col3 = st.columns(3)
+                with img_col1:
+                    image_format = st.selectbox(
+                        "格式",
+                        ["jpg", "png", "webp", "npy"],
+                        help="webp 为无损压缩；npy 把所有帧保存为一个数组文件。",
+                    )
+                with img_col2:
+                    quality = st.slider("质量", min_value=0, max_value=100, value=95)
+                with img_col3:
+                    encoder = st.selectbox("编码器", ["cv2", "pil"])
+
+            with st.expander("视频导出设置"):
+                vid_col1, vid_col2, vid_col3 = st.columns(3)
+                with vid_col1:
+                    video_backend = st.selectbox(
+                        "编码方式",
+                        ["auto", "ffmpeg", "opencv"],
+                        help="auto：本机有 ffmpeg 时用 ffmpeg，否则用 OpenCV。",
+                    )
+                    video_fps = st.number_input(
+                        "帧率", min_value=0.0, value=0.0, help="0 表示按帧时间戳自动计算"
+                    )
+                with vid_col2:
+                    video_codec = st.selectbox("编码器", ["libx264", "libx265"])
+                    video_preset = st.selectbox(
+                        "速度预设",
+                        ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"],
+                        index=2,
+                    )
+                with vid_col3:
+                    video_crf = st.slider(
+                        "CRF", min_value=0, max_value=51, value=23, help="越小画质越高"
+                    )
+                    video_threads = st.number_input("线程数", min_value=0, value=0)
+            video_options = {}
+            if video_backend != "opencv":
+                video_options = {
+                    "codec": video_codec,
+                    "preset": video_preset,
+                    "crf": video_crf,
+                    "threads": video_threads,
+                }
+
+            # 添加转图片、转视频和转帧数组按钮
+            col1, col2, col3 = st.columns(3)
 
             with col1:
                 if st.button("转为图片 📸"):
                     # 调用转换为图片的函数，传递选择的文件
-                    convert_to_images(selected_files, folder_path)
-                    st.success("图片转换成功！")
+                    convert_to_images(
+                        selected_files,
+                        folder_path,
+                        selection,
+                        image_format=image_format,
+                        quality=quality,
+                        encoder=encoder,
+                    )
 
             with col2:
                 if st.button("转为视频 🎥"):
                     # 调用转换为视频的函数，传递选择的文件
-                    convert_to_video(selected_files, folder_path)
-                    st.success("视频转换成功！")
+                    convert_to_video(
+                        selected_files,
+                        folder_path,
+                        selection=selection,
+                        fps=video_fps or None,
+                        backend=video_backend,
+                        **video_options,
+                    )
+
+            with col3:
+                if st.button(
+                    "转为帧数组 🧮", help="分块压缩保存，之后可用 FrameStore 直接切片读取"
+                ):
+                    convert_to_frame_store(selected_files, folder_path, selection)
+
+            # 转换在后台进行，这里只显示进度，切换页面或修改设置不会打断转换
+            show_jobs()
@@ -3,9 +3,18 @@ import os
 import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st
+from plotly.subplots import make_subplots
 
-from _tool_functions import auto_fft, downsample_data
+from _camera_bin import zip_members
+from _camera_stats import FRAME_STATISTICS
+from _data_store import find_data_files
+from _jobs import get_job_manager, show_jobs
+from _lod_pyramid import LodPyramid
+from _motor_dataset import get_motor_dataset
+from _spectral import SPECTRUM_METHODS
+from _tool_functions import camera_stats_job, downsample_data
 
 # 设置页面标题
 st.markdown("#### → ⚙️电机数据处理模块")
@@ -13,10 +22,20 @@ st.text("选择一个文件夹来加载电机文件。")
 
 
 @st.cache_data
-def load_data(file_path) -> pd.DataFrame:
-    if file_path:
-        return pd.read_pickle(file_path)
-    return pd.DataFrame()
+def load_camera_stats(file_path, mtime) -> pd.DataFrame:
+    # mtime 只用于在重新计算后刷新缓存
+    return pd.read_pickle(file_path)
+
+
+def find_camera_files(folder_path) -> list:
+    """文件夹中的相机 .bin 文件；没有时用 summary 压缩包中的 .bin"""
+    bin_files = sorted(f for f in os.listdir(folder_path) if f.endswith(".bin"))
+    if bin_files:
+        return [os.path.join(folder_path, f) for f in bin_files]
+    for f in sorted(os.listdir(folder_path)):
+        if f.endswith(".zip"):
+            return zip_members(os.path.join(folder_path, f))
+    return []
 
 
 # 输入文件夹路径
@@ -32,9 +51,7 @@ if folder_path:
     else:
         # 获取所有 .pkl 文件
         # .pkl结尾并且包含motor
-        pkl_files = [
-            f for f in os.listdir(folder_path) if f.endswith(".pkl") and "motor" in f
-        ]
+        pkl_files = find_data_files(folder_path, "motor")
 
         if not pkl_files:
             st.write("该文件夹中没有找到 .pkl 文件。")
@@ -62,7 +79,9 @@ if folder_path:
             if len(selected_file) > 0:
                 selected_file = selected_file[0]
                 file_path = os.path.join(folder_path, selected_file)
-                df = load_data(file_path)
+                # 整个进程共用，拉制速度、降采样、频谱等派生量只在文件改动后重新计算
+                dataset = get_motor_dataset(file_path)
+                df = dataset.df
 
                 # 显示前10行数据
                 st.write(f"文件 `{selected_file}` 中的数据")
@@ -70,11 +89,11 @@ if folder_path:
 
                 # 获取列名列表
                 columns = df.columns.tolist()
-                pull_speed = df["motor1"].mode()[0]
+                pull_speed = dataset.pull_speed
 
                 # 默认绘图
                 if "time_axis" in df.columns and "fiber diameter" in df.columns:
-                    df_sampled = downsample_data(df)
+                    df_sampled = dataset.sampled("fiber diameter")
                     fig = px.line(
                         df_sampled,
                         x="time_axis",
@@ -85,8 +104,17 @@ if folder_path:
                     st.plotly_chart(fig)
 
                     # 频谱图
-                    x_sec = df["time_axis"] * 60
-                    df_fft = auto_fft(x_sec, df["fiber diameter"], cut_off=1, downsample_length=50000)
+                    fft_method = st.radio(
+                        "频谱计算方式",
+                        SPECTRUM_METHODS,
+                        format_func={"rfft": "整段 FFT", "welch": "Welch 平均"}.get,
+                        horizontal=True,
+                    )
+                    df_fft = downsample_data(
+                        dataset.spectrum("fiber diameter", method=fft_method),
+                        50000,
+                        columns="y_fft",
+                    )
                     fig_fft = px.line(
                         df_fft,
                         x="x_fft",
@@ -95,11 +123,141 @@ if folder_path:
                     )
 
                     st.plotly_chart(fig_fft)
+
+                    # 频谱图：直径振荡随时间的变化，只计算所选时间范围内还没算过的窗口
+                    with st.expander("直径频谱图"):
+                        sg_col1, sg_col2 = st.columns(2)
+                        with sg_col1:
+                            window_seconds = st.number_input(
+                                "窗口长度 (s)", min_value=1.0, value=60.0, step=10.0
+                            )
+                        with sg_col2:
+                            step_seconds = st.number_input(
+                                "窗口间隔 (s)", min_value=0.1, value=10.0, step=1.0
+                            )
+                        t_min = float(df["time_axis"].iloc[0])
+                        t_max = float(df["time_axis"].iloc[-1])
+                        sg_range = st.slider(
+                            "时间范围 (min)", t_min, t_max, (t_min, t_max)
+                        )
+                        sg_times, sg_freqs, sg_amplitude = dataset.spectrogram(
+                            "fiber diameter",
+                            sg_range,
+                            window_seconds,
+                            step_seconds,
+                            cut_off=1,
+                        )
+                        if len(sg_times) == 0:
+                            st.write("时间范围比窗口短，无法计算频谱图。")
+                        else:
+                            # 窗口太多时按最大值合并相邻窗口，不丢失短暂的振荡
+                            tile = LodPyramid(sg_amplitude, "max").tile()
+                            fig_sg = go.Figure(
+                                go.Heatmap(
+                                    x=sg_times[tile["rows"]],
+                                    y=sg_freqs[tile["cols"]],
+                                    z=tile["z"].T,
+                                    colorscale="Viridis",
+                                )
+                            )
+                            fig_sg.update_layout(
+                                title=f"{selected_file} - 直径频谱图",
+                                xaxis_title="Time (min)",
+                                yaxis_title="Frequency (Hz)",
+                            )
+                            st.plotly_chart(fig_sg)
                 else:
                     st.write(
                         "数据中缺少 `time_axis` 或 `fiber diameter` 列，无法绘制默认图表。"
                     )
 
+                # 相机每帧统计量（亮度、熔区质心等），与电机数据按时间对齐画在一起
+                with st.expander("相机统计量"):
+                    camera_files = find_camera_files(folder_path)
+                    stats_path = os.path.join(folder_path, "camera_stats.pkl")
+                    if not camera_files:
+                        st.write("文件夹中没有相机数据（.bin 文件或 summary 压缩包）。")
+                    else:
+                        stats_col1, stats_col2, stats_col3 = st.columns(3)
+                        with stats_col1:
+                            stat_names = st.multiselect(
+                                "统计量",
+                                list(FRAME_STATISTICS),
+                                default=["mean", "centroid"],
+                            )
+                        with stats_col2:
+                            stats_stride = st.number_input(
+                                "每 N 帧取一帧", min_value=1, value=10, step=1
+                            )
+                        with stats_col3:
+                            threshold = st.number_input(
+                                "熔区亮度阈值",
+                                min_value=0,
+                                max_value=255,
+                                value=200,
+                                help="亮度不低于该值的像素计入熔区质心",
+                            )
+                        if st.button("计算相机统计量") and stat_names:
+                            get_job_manager().submit(
+                                "相机统计量",
+                                camera_stats_job,
+                                camera_files,
+                                stats_path,
+                                tuple(stat_names),
+                                {"stride": stats_stride},
+                                threshold=threshold,
+                            )
+                        show_jobs()
+
+                    if os.path.isfile(stats_path):
+                        stats_df = load_camera_stats(
+                            stats_path, os.path.getmtime(stats_path)
+                        )
+                        stat_columns = [
+                            c for c in stats_df.columns if c not in ("file", "time_min")
+                        ]
+                        plot_col1, plot_col2, plot_col3 = st.columns(3)
+                        with plot_col1:
+                            motor_column = st.selectbox(
+                                "电机数据",
+                                columns,
+                                index=columns.index("fiber diameter")
+                                if "fiber diameter" in columns
+                                else 0,
+                            )
+                        with plot_col2:
+                            stat_column = st.selectbox("相机统计量", stat_columns)
+                        with plot_col3:
+                            time_offset = st.number_input(
+                                "相机时间偏移 (min)",
+                                value=0.0,
+                                step=0.01,
+                                help="相机第一帧相对电机数据起点的时间",
+                            )
+                        if "time_axis" in df.columns and stat_column:
+                            motor_sampled = dataset.sampled(motor_column)
+                            stats_sampled = downsample_data(
+                                stats_df, columns=stat_column
+                            )
+                            fig = make_subplots(rows=2, cols=1, shared_xaxes=True)
+                            fig.add_scatter(
+                                x=motor_sampled["time_axis"],
+                                y=motor_sampled[motor_column],
+                                name=motor_column,
+                                row=1,
+                                col=1,
+                            )
+                            fig.add_scatter(
+                                x=stats_sampled["time_min"] + time_offset,
+                                y=stats_sampled[stat_column],
+                                name=stat_column,
+                                row=2,
+                                col=1,
+                            )
+                            fig.update_xaxes(title_text="Time (min)", row=2, col=1)
+                            fig.update_layout(title=f"{selected_file} - 相机统计量")
+                            st.plotly_chart(fig)
+
                 # 手动选择列并更新绘图
                 st.markdown(
                     f"本次拉制速度：***{pull_speed:.2f} mm/min***, 选择需要的列："
@@ -119,7 +277,7 @@ if folder_path:
                 )
 
                 if st.button("更新图表"):
-                    df_sampled = downsample_data(df)
+                    df_sampled = dataset.sampled(y_axis)
                     fig = px.line(
                         df_sampled,
                         x=x_axis,
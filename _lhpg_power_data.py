@@ -72,7 +72,7 @@ if folder_path:
                 st.dataframe(df.head(10))
 
                 # 默认绘图
-                df_sampled = downsample_data(df)
+                df_sampled = downsample_data(df, columns="power")
                 fig = go.Figure()
                 fig.add_trace(
                     go.Scatter(
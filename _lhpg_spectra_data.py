@@ -1,21 +1,29 @@
 import os
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st
 
+from _data_store import find_data_files
+from _lod_pyramid import LodPyramid
+from _spectra_dataset import get_spectra_data
 from _tool_functions import downsample_data, get_intensity_by_wavelength
 
+REDUCER_NAMES = {"max": "最大值", "mean": "平均值", "min": "最小值"}
+
 # 设置页面标题
 st.markdown("#### → 🌈光谱数据处理模块")
 st.text("选择一个文件夹来加载光谱数据文件。")
 
 
-@st.cache_data
-def load_data(file_path) -> pd.DataFrame:
-    if file_path:
-        return pd.read_pickle(file_path)
-    return pd.DataFrame()
+@st.cache_resource
+def load_pyramid(file_path, mtime, reducer) -> LodPyramid:
+    """光谱热图用的多分辨率金字塔，每个文件、每种归约方式只建一次"""
+    data = get_spectra_data(file_path)
+    # 金字塔各层保存在 .spectra 目录中，下次打开直接内存映射读取
+    return LodPyramid(data.intensity, reducer, cache_dir=data.store_path)
 
 
 # 输入文件夹路径
@@ -30,9 +38,7 @@ if folder_path:
         st.write("输入的文件夹路径无效，请重新输入。")
     else:
         # 获取所有包含“spectra”的 .pkl 文件
-        spectra_files = [
-            f for f in os.listdir(folder_path) if f.endswith(".pkl") and "spectra" in f
-        ]
+        spectra_files = find_data_files(folder_path, "spectra")
 
         if not spectra_files:
             st.write("该文件夹中没有找到包含 'spectra' 的 .pkl 文件。")
@@ -59,7 +65,7 @@ if folder_path:
             if len(selected_file) > 0:
                 selected_file = selected_file[0]
                 file_path = os.path.join(folder_path, selected_file)
-                df = load_data(file_path)
+                df = get_spectra_data(file_path)
 
                 # 显示数据统计
                 total_rows = len(df)
@@ -80,8 +86,8 @@ if folder_path:
                     )
 
                     # 获取指定行的光谱数据
-                    wavelengths = df["wavelengths"].iloc[row_to_plot]
-                    intensitys = df["intensitys"].iloc[row_to_plot]
+                    wavelengths = df.wavelengths
+                    intensitys = df.spectrum(row_to_plot)
 
                     # 绘制光谱图
                     fig = px.line(
@@ -96,31 +102,120 @@ if folder_path:
                         "数据中缺少 `time_axis`、`wavelengths` 或 `intensitys` 列，无法绘制光谱图。"
                     )
 
-                # 输入查询的波长值
-                wavelength = st.number_input(
-                    "输入要查询的波长（nm）",
-                    min_value=0.0,
-                    max_value=4000.0,
-                    value=1550.0,
+                # 波长 × 时间热图：从金字塔中按可见范围取合适分辨率的一块
+                if len(df) and st.checkbox("显示光谱热图"):
+                    heat_col1, heat_col2 = st.columns([3, 1])
+                    with heat_col1:
+                        time_axis = df["time_axis"].to_numpy()
+                        time_range = st.slider(
+                            "时间范围 (min)",
+                            min_value=float(time_axis[0]),
+                            max_value=float(time_axis[-1]),
+                            value=(float(time_axis[0]), float(time_axis[-1])),
+                        )
+                        wavelength_range = st.slider(
+                            "波长范围 (nm)",
+                            min_value=float(df.wavelengths[0]),
+                            max_value=float(df.wavelengths[-1]),
+                            value=(
+                                float(df.wavelengths[0]),
+                                float(df.wavelengths[-1]),
+                            ),
+                        )
+                    with heat_col2:
+                        reducer = st.selectbox(
+                            "合并方式",
+                            ["max", "mean", "min"],
+                            format_func=REDUCER_NAMES.get,
+                            help="缩小显示时每个格子代表多个数据点，最大值不会漏掉尖峰",
+                        )
+                    with st.spinner("正在生成热图..."):
+                        pyramid = load_pyramid(
+                            file_path, os.path.getmtime(file_path), reducer
+                        )
+                    rows = np.searchsorted(time_axis, time_range, side="right")
+                    cols = np.searchsorted(df.wavelengths, wavelength_range, side="right")
+                    tile = pyramid.tile(
+                        (max(rows[0] - 1, 0), rows[1]), (max(cols[0] - 1, 0), cols[1])
+                    )
+                    fig = go.Figure(
+                        go.Heatmap(
+                            x=time_axis[tile["rows"]],
+                            y=df.wavelengths[tile["cols"]],
+                            z=tile["z"].T,
+                            colorscale="Viridis",
+                        )
+                    )
+                    fig.update_layout(
+                        title=f"{selected_file} - 光谱热图"
+                        f"（每格 {tile['row_step']} 行 × {tile['col_step']} 个波长）",
+                        xaxis_title="Time (min)",
+                        yaxis_title="Wavelength (nm)",
+                    )
+                    st.plotly_chart(fig)
+
+                # 输入查询的波长值，可以一次查询多个波长
+                wavelength_text = st.text_input(
+                    "输入要查询的波长（nm），多个波长用逗号分隔", value="1550"
                 )
+                try:
+                    wavelengths = [
+                        float(w)
+                        for w in wavelength_text.replace("，", ",").split(",")
+                        if w.strip()
+                    ]
+                except ValueError:
+                    st.error("波长格式不正确，请输入数字，多个波长用逗号分隔。")
+                    wavelengths = []
 
                 # 是否平滑和转换为 dB
-                smooth = st.checkbox("平滑数据")
-                to_db = st.checkbox("将强度转换为 dB")
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    smooth = st.checkbox("平滑数据")
+                with col2:
+                    to_db = st.checkbox("将强度转换为 dB")
+                with col3:
+                    method = st.selectbox(
+                        "取值方式",
+                        ["nearest", "linear"],
+                        format_func={"nearest": "最近点", "linear": "插值"}.get,
+                    )
+                with col4:
+                    bandwidth = st.number_input(
+                        "积分带宽 (nm)",
+                        min_value=0.0,
+                        value=0.0,
+                        help="大于 0 时对 波长±带宽/2 内的强度积分",
+                    )
 
-                # 获取指定波长的强度值
-                intensity = get_intensity_by_wavelength(
-                    df, wavelength, smooth=smooth, to_db=to_db
-                )
+                if wavelengths:
+                    # 所有波长的强度一次取出，(行数, 波长数)
+                    intensity = get_intensity_by_wavelength(
+                        df,
+                        wavelengths,
+                        smooth=smooth,
+                        to_db=to_db,
+                        method=method,
+                        bandwidth=bandwidth or None,
+                    )
+                    df_plot = pd.DataFrame(
+                        intensity, columns=[f"{w:g} nm" for w in wavelengths]
+                    )
+                    df_plot.insert(0, "time_axis", df["time_axis"].to_numpy())
 
-                # 绘制强度值的时间序列图
-                fig = px.line(
-                    x=downsample_data(df["time_axis"].to_numpy()),
-                    y=downsample_data(intensity),
-                    labels={
-                        "x": "Time (minutes)",
-                        "y": "Intensity (dB)" if to_db else "Intensity",
-                    },
-                    title=f"{selected_file} - {wavelength} nm 处的光谱强度",
-                )
-                st.plotly_chart(fig)
+                    # 绘制强度值的时间序列图
+                    df_plot = downsample_data(
+                        df_plot, columns=list(df_plot.columns[1:])
+                    )
+                    fig = px.line(
+                        df_plot,
+                        x="time_axis",
+                        y=df_plot.columns[1:],
+                        labels={
+                            "time_axis": "Time (minutes)",
+                            "value": "Intensity (dB)" if to_db else "Intensity",
+                        },
+                        title=f"{selected_file} - "
+                        f"{', '.join(f'{w:g}' for w in wavelengths)} nm 处的光谱强度",
+                    )
+                    st.plotly_chart(fig)
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+
+# 金字塔每一层的块归约方式；均值忽略 NaN（插值到共同波长轴时超出范围的点）
+LOD_REDUCERS = ("mean", "min", "max")
+
+
+def _block_reduce(block, factor, axis, reducer) -> np.ndarray:
+    """沿 axis 每 factor 个元素归约为一个，最后一块可以不满"""
+    starts = np.arange(0, block.shape[axis], factor)
+    if reducer == "min":
+        return np.fmin.reduceat(block, starts, axis=axis)
+    if reducer == "max":
+        return np.fmax.reduceat(block, starts, axis=axis)
+    finite = np.isfinite(block)
+    sums = np.add.reduceat(np.where(finite, block, 0), starts, axis=axis)
+    counts = np.add.reduceat(finite, starts, axis=axis, dtype=np.int32)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (sums / counts).astype(np.float32)
+
+
+class LodPyramid:
+    """二维矩阵（如 时间 × 波长 的光谱强度）按行的多分辨率金字塔。
+
+    每一层的行数缩小为上一层的 1/factor，每个格子是原矩阵对应 factor^k 行的均值
+    （或最小/最大值），列不合并，放大到窄波长范围时仍有完整的波长分辨率。
+    显示时按可见行数选最细而又不超过 max_rows 的一层，只切出可见的一块，列数多于
+    max_cols 时再临时合并，浏览器不需要拿到整个矩阵。
+
+    原矩阵可以是内存映射数组，建层时按行分块读取；给出 cache_dir 时各层保存为
+    lod_<归约方式>_<层号>.npy 并以内存映射方式读取，下次直接复用。
+
+    Example:
+        pyramid = LodPyramid(data.intensity, "max")
+        tile = pyramid.tile(row_range=(0, 50000), col_range=(100, 900))
+    """
+
+    def __init__(
+        self,
+        matrix,
+        reducer="mean",
+        factor=4,
+        min_rows=256,
+        chunk_rows=8192,
+        cache_dir=None,
+    ):
+        if reducer not in LOD_REDUCERS:
+            raise ValueError(f"未知的归约方式：{reducer}")
+        self.reducer = reducer
+        self.factor = factor
+        self.levels = [matrix]
+        while len(self.levels[-1]) > min_rows:
+            level = len(self.levels)
+            cache_path = None
+            if cache_dir:
+                cache_path = os.path.join(cache_dir, f"lod_{reducer}_{level}.npy")
+            n_rows = -(-len(self.levels[-1]) // factor)
+            if cache_path and os.path.exists(cache_path):
+                array = np.load(cache_path, mmap_mode="r")
+                if array.shape == (n_rows, matrix.shape[1]):
+                    self.levels.append(array)
+                    continue
+            self.levels.append(
+                self._reduce_level(self.levels[-1], chunk_rows, cache_path)
+            )
+
+    def _reduce_level(self, matrix, chunk_rows, cache_path=None) -> np.ndarray:
+        chunk_rows -= chunk_rows % self.factor
+        shape = (-(-len(matrix) // self.factor), matrix.shape[1])
+        if cache_path:
+            tmp_path = cache_path + ".tmp.npy"
+            out = np.lib.format.open_memmap(tmp_path, "w+", np.float32, shape)
+        else:
+            out = np.empty(shape, dtype=np.float32)
+        for start in range(0, len(matrix), chunk_rows):
+            block = np.asarray(matrix[start : start + chunk_rows], dtype=np.float32)
+            block = _block_reduce(block, self.factor, 0, self.reducer)
+            out[start // self.factor : start // self.factor + len(block)] = block
+        if cache_path:
+            out.flush()
+            del out
+            os.replace(tmp_path, cache_path)
+            return np.load(cache_path, mmap_mode="r")
+        return out
+
+    @property
+    def shape(self) -> tuple:
+        return self.levels[0].shape
+
+    def tile(self, row_range=None, col_range=None, max_rows=600, max_cols=800) -> dict:
+        """取出可见范围 [row0, row1) × [col0, col1) 的一块。
+
+        Returns:
+            {"z": 数组, "rows": 每行对应原矩阵的起始行号, "cols": 每列对应的起始列号,
+             "row_step"/"col_step": 每格对应的原矩阵行数/列数, "level": 层号}
+        """
+        row0, row1 = row_range or (0, self.shape[0])
+        col0, col1 = col_range or (0, self.shape[1])
+        row1, col1 = max(row1, row0 + 1), max(col1, col0 + 1)
+        level = 0
+        while (
+            level + 1 < len(self.levels)
+            and (row1 - row0) / self.factor**level > max_rows
+        ):
+            level += 1
+        row_step = self.factor**level
+        rows = np.arange(row0 // row_step, -(-row1 // row_step))
+        z = np.asarray(self.levels[level][rows[0] : rows[-1] + 1, col0:col1])
+        cols = np.arange(col0, col1)
+        col_step = -(-len(cols) // max_cols)
+        if col_step > 1:
+            # 列太多时临时合并相邻的列
+            z = _block_reduce(z.astype(np.float32), col_step, 1, self.reducer)
+            cols = cols[::col_step]
+        return {
+            "z": z,
+            "rows": rows * row_step,
+            "cols": cols,
+            "row_step": row_step,
+            "col_step": col_step,
+            "level": level,
+        }
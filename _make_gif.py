@@ -3,7 +3,9 @@ import os
 import cv2
 import pandas as pd
 import streamlit as st
-from PIL import Image
+
+from _jobs import get_job_manager, show_jobs
+from _tool_functions import make_gif_job
 
 # 设置页面标题
 st.markdown("#### GIF 制作工具")
@@ -129,75 +131,22 @@ if folder_path:
                         )
 
                     if st.button("生成 GIF"):
-                        images = []
-                        read_process_bar = st.progress(
-                            0, text="正在读取第 0 个文件"
-                        )  # 初始化进度条
-                        total_files = len(selected_files)
-
-                        for i, file in enumerate(selected_files):
-                            file_path = os.path.join(folder_path, file)
-                            if file.lower().endswith((".mp4", ".avi")):
-                                # 读取视频文件并提取帧
-                                cap = cv2.VideoCapture(file_path)
-                                frame_start = int(start_time * video_fps)
-                                frame_end = int(end_time * video_fps)
-                                frame_step = int(speed_multiplier)
-
-                                current_frame = frame_start
-                                while current_frame <= frame_end:
-                                    cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-                                    ret, frame = cap.read()
-                                    if not ret:
-                                        break
-                                    images.append(
-                                        Image.fromarray(
-                                            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                                        )
-                                    )
-                                    current_frame += frame_step
-                                cap.release()
-                                st.write(
-                                    f"视频文件 {file} 已提取 {len(images)} 张图片。"
-                                )
-                            else:
-                                # 读取图片文件
-                                img = Image.open(file_path)
-                                images.append(img)
-
-                            # 更新进度条
-                            read_process_bar.progress(
-                                (i + 1) / total_files, text=f"正在读取第 {i + 1} 个文件"
-                            )
-                        read_process_bar.empty()
-
-                        # 创建 GIF
-                        gif_path = os.path.join(folder_path, output_filename)
-                        if images:
-                            if compression_choice == "无损":
-                                compressed_images = images  # 无损处理，直接使用原图
-                            else:
-                                with st.spinner("正在压缩图片..."):
-                                    color_reduction = int(
-                                        compression_choice
-                                    )  # 将选择的压缩比转为整数
-                                    compressed_images = [
-                                        img.convert(
-                                            "P",
-                                            palette=Image.ADAPTIVE,
-                                            colors=color_reduction,
-                                        )
-                                        for img in images
-                                    ]
-                            duration = 1000 // fps  # 转换为毫秒
-                            with st.spinner("正在生成 GIF..."):
-                                compressed_images[0].save(
-                                    gif_path,
-                                    save_all=True,
-                                    append_images=compressed_images[1:],
-                                    duration=duration,
-                                    loop=0,
-                                )
-                            st.success(f"GIF 文件已生成: {gif_path}")
-                        else:
-                            st.error("未能生成 GIF，检查选择的文件是否有效。")
+                        # 在后台任务中生成，页面刷新不会打断
+                        trim = {}
+                        if selected_files[0].lower().endswith((".mp4", ".avi")):
+                            trim = {
+                                "start_time": start_time,
+                                "end_time": end_time,
+                                "speed_multiplier": speed_multiplier,
+                            }
+                        get_job_manager().submit(
+                            f"生成 GIF {output_filename}",
+                            make_gif_job,
+                            [os.path.join(folder_path, f) for f in selected_files],
+                            os.path.join(folder_path, output_filename),
+                            fps,
+                            compression_choice,
+                            **trim,
+                        )
+
+                    show_jobs()
@@ -2,7 +2,9 @@ import os
 
 import pandas as pd
 import streamlit as st
-from PIL import Image
+
+from _jobs import get_job_manager, show_jobs
+from _tool_functions import make_pdf_job
 
 # 新建 PDF 制作页面
 st.markdown("#### PDF 制作工具")
@@ -55,22 +57,14 @@ if folder_path:
 
             if st.button("生成 PDF"):
                 if selected_files:
-                    with st.spinner("正在生成 PDF..."):
-                        pdf_path = os.path.join(folder_path, output_filename)
-                        images = []
-
-                        for file in selected_files:
-                            img_path = os.path.join(folder_path, file)
-                            image = Image.open(img_path)
-                            images.append(image.convert("RGB"))  # 转换为 RGB
-
-                        # 保存为 PDF
-                        if images:
-                            images[0].save(
-                                pdf_path, save_all=True, append_images=images[1:]
-                            )
-                            st.success(f"PDF 文件已生成: {pdf_path}")
-                        else:
-                            st.error("未能生成 PDF，检查选择的文件是否有效。")
+                    # 在后台任务中生成，页面刷新不会打断
+                    get_job_manager().submit(
+                        f"生成 PDF {output_filename}",
+                        make_pdf_job,
+                        [os.path.join(folder_path, f) for f in selected_files],
+                        os.path.join(folder_path, output_filename),
+                    )
                 else:
                     st.error("请至少选择一个文件。")
+
+            show_jobs()
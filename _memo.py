@@ -0,0 +1,54 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+def fingerprint(values) -> tuple | None:
+    """数组内容的缓存键：dtype、长度和 CRC32；values 为 None 时返回 None"""
+    if values is None:
+        return None
+    values = np.ascontiguousarray(values)
+    return (values.dtype.str, len(values), zlib.crc32(values))
+
+
+class LruCache:
+    """线程安全的进程内 LRU 缓存，超过 maxsize 项时丢掉最久没用的。
+
+    计算在锁外进行，不同的键可以同时计算。值不能为 None（None 表示没有缓存）。
+
+    Example:
+        _cache = LruCache(64)
+        result = _cache.get_or_compute(key, lambda: compute(...))
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """取出 key 对应的值，没有时返回 None"""
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
@@ -0,0 +1,124 @@
+import os
+import threading
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from _data_store import load_motor
+from _downsample import downsample
+from _spectral import motor_spectrogram, motor_spectrum
+
+
+class MotorDataset:
+    """一次实验的电机数据及其派生量（拉制速度、长度轴、各列统计量、频谱）。
+
+    派生量第一次用到时计算并保存在对象中，之后直接返回；通过 get_motor_dataset
+    取得的对象在文件不变时一直复用，文件改动后换成新对象。
+
+    Example:
+        dataset = get_motor_dataset("LHPG-motor.pkl")
+        dataset.pull_speed, dataset.stats("fiber diameter")
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _memoized(self, key, compute):
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        value = compute()
+        with self._lock:
+            self._memo[key] = value
+        return value
+
+    @cached_property
+    def df(self) -> pd.DataFrame:
+        return load_motor(self.file_path)
+
+    @property
+    def columns(self) -> list:
+        return self.df.columns.tolist()
+
+    def __len__(self):
+        return len(self.df)
+
+    @cached_property
+    def pull_speed(self) -> float:
+        """拉制速度 (mm/min)：motor1 的众数"""
+        return float(self.df["motor1"].mode()[0])
+
+    @cached_property
+    def length_axis(self) -> np.ndarray:
+        """已拉制的长度 (mm)：time_axis × 拉制速度"""
+        return self.df["time_axis"].to_numpy() * self.pull_speed
+
+    def x_axis(
+        self, rows=slice(None), use_length=True, start_at_zero=True
+    ) -> np.ndarray:
+        """绘图用的横轴：时间 (min) 或长度 (mm)，可以从零开始"""
+        axis = self.length_axis if use_length else self.df["time_axis"].to_numpy()
+        axis = axis[rows]
+        if start_at_zero and len(axis):
+            axis = axis - axis[0]
+        return axis
+
+    def stats(self, column) -> dict:
+        """某一列的统计量：mean、std、min、max、median"""
+
+        def compute():
+            values = self.df[column]
+            return {
+                "mean": float(values.mean()),
+                "std": float(values.std()),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                "median": float(values.median()),
+            }
+
+        return self._memoized(("stats", column), compute)
+
+    def sampled(self, columns, max_points=20000) -> pd.DataFrame:
+        """绘图用的降采样数据（见 downsample_data）"""
+        if isinstance(columns, str):
+            columns = [columns]
+        return self._memoized(
+            ("sampled", tuple(columns), max_points),
+            lambda: downsample(self.df, max_points, columns=columns),
+        )
+
+    def spectrum(
+        self, column, cut_off=1.0, method="rfft", time_range=None
+    ) -> pd.DataFrame:
+        """某一列的频谱（见 _spectral.motor_spectrum）"""
+        return self._memoized(
+            ("spectrum", column, cut_off, method, time_range),
+            lambda: motor_spectrum(self.file_path, column, time_range, cut_off, method),
+        )
+
+    def spectrogram(
+        self,
+        column,
+        time_range=None,
+        window_seconds=60.0,
+        step_seconds=10.0,
+        cut_off=1.0,
+    ) -> tuple:
+        """某一列的频谱图（见 _spectral.motor_spectrogram，按窗口块缓存）"""
+        return motor_spectrogram(
+            self.file_path, column, time_range, window_seconds, step_seconds, cut_off
+        )
+
+
+@st.cache_resource(max_entries=8)
+def _open_dataset(file_path, mtime) -> MotorDataset:
+    return MotorDataset(file_path)
+
+
+def get_motor_dataset(file_path) -> MotorDataset:
+    """整个 Streamlit 进程共用的电机数据对象，文件修改时间变化后重新加载"""
+    return _open_dataset(file_path, os.path.getmtime(file_path))
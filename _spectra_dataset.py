@@ -0,0 +1,16 @@
+import os
+
+import streamlit as st
+
+from _data_store import SpectraData, load_spectra
+
+
+@st.cache_resource(max_entries=8)
+def _open_spectra(file_path, mtime) -> SpectraData:
+    # 强度矩阵为内存映射数组，用 cache_resource 避免每次复制
+    return load_spectra(file_path)
+
+
+def get_spectra_data(file_path) -> SpectraData:
+    """整个 Streamlit 进程共用的光谱数据对象，文件修改时间变化后重新加载"""
+    return _open_spectra(file_path, os.path.getmtime(file_path))
@@ -0,0 +1,304 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import fft as sp_fft
+from scipy import signal
+
+from _data_store import load_motor
+from _memo import LruCache, fingerprint
+
+# 频谱的计算方式：
+#   rfft:  整段实数 FFT，长度补零到 FFT 友好的长度（2、3、5 的乘积）
+#   welch: Welch 平均周期图，分段加窗后平均，噪声更小、频率分辨率更低
+SPECTRUM_METHODS = ("rfft", "welch")
+
+# 抽取后的采样率至少为截断频率的这么多倍，抗混叠滤波器的过渡带落在截断频率以上
+DECIMATE_MARGIN = 5
+
+# 采样时刻与等间隔网格的最大偏差不超过 UNIFORM_PHASE_TOLERANCE / cut_off 时按等间隔处理
+# （在截断频率上的相位误差不超过 2π × 0.01 ≈ 3.6°）
+UNIFORM_PHASE_TOLERANCE = 0.01
+
+_BLOCK = 1 << 20  # 分块处理长信号时每块的点数
+
+_cache = LruCache(256)
+
+
+def sampling_deviation(time_axis) -> float:
+    """采样时刻相对等间隔网格 t0 + i·dt 的最大偏差（与时间轴同单位），
+    分块计算，不生成整段长度的临时数组"""
+    t0 = float(time_axis[0])
+    dt = (float(time_axis[-1]) - t0) / (len(time_axis) - 1)
+    deviation = 0.0
+    for start in range(0, len(time_axis), _BLOCK):
+        block = np.asarray(time_axis[start : start + _BLOCK], dtype=np.float64)
+        grid = t0 + dt * np.arange(start, start + len(block))
+        deviation = max(deviation, float(np.abs(block - grid).max()))
+    return deviation
+
+
+def grid_average(time_axis, y_axis, interval, time_scale=1.0) -> np.ndarray:
+    """非均匀采样的网格化（盒形核的 NUFFT 做法）：按 interval 宽的时间格求平均，
+    没有采样点的格子用相邻格子线性插值。分块累加，只有输出长度的临时数组。
+
+    Args:
+        interval: 格宽（秒）
+        time_scale: 时间轴单位换算到秒的倍数（time_axis 为分钟时为 60）
+    Returns:
+        每格的平均值（float32），第一格从 time_axis[0] 开始
+    """
+    t0 = float(time_axis[0]) * time_scale
+    n_bins = int((float(time_axis[-1]) * time_scale - t0) / interval) + 1
+    sums = np.zeros(n_bins)
+    counts = np.zeros(n_bins)
+    for start in range(0, len(time_axis), _BLOCK):
+        t = np.asarray(time_axis[start : start + _BLOCK], dtype=np.float64)
+        y = np.asarray(y_axis[start : start + _BLOCK], dtype=np.float64)
+        valid = np.isfinite(y) & np.isfinite(t)
+        bins = ((t[valid] * time_scale - t0) / interval).astype(np.int64)
+        bins = np.clip(bins, 0, n_bins - 1)
+        sums += np.bincount(bins, y[valid], n_bins)
+        counts += np.bincount(bins, minlength=n_bins)
+    filled = counts > 0
+    values = np.zeros(n_bins, dtype=np.float32)
+    values[filled] = sums[filled] / counts[filled]
+    if filled.any() and not filled.all():
+        positions = np.arange(n_bins)
+        empty = ~filled
+        values[empty] = np.interp(positions[empty], positions[filled], values[filled])
+    return values
+
+
+def regular_signal(time_axis, y_axis, cut_off, time_scale=1.0) -> tuple:
+    """把可能非均匀采样的信号变为低采样率的等间隔 float32 信号，用于 cut_off 以下的频谱。
+
+    采样时刻与等间隔网格的偏差在截断频率上造成的相位误差很小时（近似均匀采样，
+    如定时记录的电机数据）直接当作等间隔信号，不插值；否则按时间格求平均。
+
+    Returns:
+        (y, 采样间隔 s, 盒形核宽度 s)；核宽度不为 0 时频谱要除以 sinc(f × 核宽度)
+    """
+    n = len(time_axis)
+    duration = (float(time_axis[-1]) - float(time_axis[0])) * time_scale
+    if sampling_deviation(time_axis) * time_scale <= UNIFORM_PHASE_TOLERANCE / cut_off:
+        y = np.asarray(y_axis, dtype=np.float32)
+        y, interval = decimate(y, duration / (n - 1), cut_off)
+        return y, interval, 0.0
+    interval = max(1 / (DECIMATE_MARGIN * cut_off), duration / (n - 1))
+    return grid_average(time_axis, y_axis, interval, time_scale), interval, interval
+
+
+def decimate(y, interval, cut_off) -> tuple:
+    """抗混叠抽取：多相 FIR 低通后降到约 DECIMATE_MARGIN × cut_off 的采样率。
+
+    Returns:
+        (抽取后的 y, 新的采样间隔)
+    """
+    factor = int(1 / (interval * DECIMATE_MARGIN * cut_off))
+    if factor <= 1:
+        return y, interval
+    return signal.resample_poly(y, 1, factor), interval * factor
+
+
+def amplitude_spectrum(y, interval, cut_off, method="rfft", nperseg=None) -> tuple:
+    """等间隔信号的单边幅度谱，只返回 0 < f < cut_off 的部分。
+
+    Args:
+        interval: 采样间隔（秒）
+        method: SPECTRUM_METHODS 之一
+        nperseg: Welch 每段的点数，默认每段 1/8 的信号长度
+    Returns:
+        (频率, 幅度)，正弦信号的幅度即其振幅
+    """
+    if method not in SPECTRUM_METHODS:
+        raise ValueError(f"未知的频谱计算方式：{method}")
+    y = np.asarray(y, dtype=np.float32)
+    y = y - np.float32(y.mean(dtype=np.float64))
+    if method == "welch":
+        nperseg = min(nperseg or max(len(y) // 8, 16), len(y))
+        xf, power = signal.welch(
+            y,
+            fs=1 / interval,
+            nperseg=nperseg,
+            nfft=sp_fft.next_fast_len(nperseg, real=True),
+            scaling="spectrum",
+        )
+        yf = np.sqrt(2 * power)
+    else:
+        n_fft = sp_fft.next_fast_len(len(y), real=True)
+        yf = np.abs(sp_fft.rfft(y, n=n_fft)) * (2 / len(y))
+        xf = sp_fft.rfftfreq(n_fft, interval)
+    keep = (xf > 0) & (xf < cut_off)
+    return xf[keep], yf[keep]
+
+
+def spectrum(time_axis, y_axis, cut_off, method="rfft", nperseg=None) -> pd.DataFrame:
+    """可以是非均匀采样的信号的频谱：等间隔化并降到低采样率（见 regular_signal）→ rfft/Welch。
+
+    Args:
+        time_axis: 时间轴（秒）
+        cut_off: 截断频率（Hz）
+    Returns:
+        dataframe({"x_fft": 频率, "y_fft": 幅度})
+    """
+    key = (
+        "array",
+        fingerprint(time_axis),
+        fingerprint(y_axis),
+        cut_off,
+        method,
+        nperseg,
+    )
+    return _cache.get_or_compute(
+        key, lambda: _spectrum(time_axis, y_axis, cut_off, method, nperseg)
+    )
+
+
+def _spectrum(
+    time_axis, y_axis, cut_off, method, nperseg, time_scale=1.0
+) -> pd.DataFrame:
+    if len(time_axis) < 2:
+        return pd.DataFrame({"x_fft": [], "y_fft": []})
+    y, interval, kernel_width = regular_signal(time_axis, y_axis, cut_off, time_scale)
+    xf, yf = amplitude_spectrum(y, interval, cut_off, method, nperseg)
+    if kernel_width:
+        yf = yf / _box_response(xf, kernel_width)
+    return pd.DataFrame({"x_fft": xf, "y_fft": yf})
+
+
+def _box_response(freqs, width) -> np.ndarray:
+    """按 width 宽的时间格求平均对各频率幅度的衰减"""
+    return np.maximum(np.sinc(freqs * width), 0.5).astype(np.float32)
+
+
+def motor_spectrum(
+    file_path,
+    column,
+    time_range=None,
+    cut_off=1.0,
+    method="rfft",
+    nperseg=None,
+) -> pd.DataFrame:
+    """电机数据某一列的频谱，按 (文件, 列, 时间范围, 参数) 缓存，文件改动后重新计算。
+
+    Args:
+        column: 列名，如 "fiber diameter"
+        time_range: (起, 止)，单位与 time_axis 相同（分钟），默认全部
+        cut_off: 截断频率（Hz）
+    """
+    stat = os.stat(file_path)
+    key = (
+        "motor",
+        file_path,
+        stat.st_mtime_ns,
+        stat.st_size,
+        column,
+        tuple(time_range) if time_range is not None else None,
+        cut_off,
+        method,
+        nperseg,
+    )
+
+    def compute():
+        df = load_motor(file_path, columns=["time_axis", column])
+        time_axis = df["time_axis"].to_numpy()
+        values = df[column].to_numpy()
+        if time_range is not None:
+            start, end = np.searchsorted(time_axis, time_range)
+            time_axis, values = time_axis[start:end], values[start:end]
+        return _spectrum(time_axis, values, cut_off, method, nperseg, time_scale=60)
+
+    return _cache.get_or_compute(key, compute)
+
+
+# 频谱图按固定的窗口网格分块计算：第 k 个窗口从 k × step 开始，
+# 每 SPECTROGRAM_CHUNK 个窗口为一块，单独缓存；时间范围改变时只计算新出现的块。
+SPECTROGRAM_CHUNK = 256
+
+
+def _motor_signal(file_path, column, cut_off) -> tuple:
+    """等间隔化并降到低采样率后的整段信号（见 regular_signal），
+    返回 (起始时间 s, y, 采样间隔 s, 盒形核宽度 s)"""
+    stat = os.stat(file_path)
+    key = ("signal", file_path, stat.st_mtime_ns, stat.st_size, column, cut_off)
+
+    def compute():
+        df = load_motor(file_path, columns=["time_axis", column])
+        time_axis = df["time_axis"].to_numpy()
+        regular = regular_signal(time_axis, df[column].to_numpy(), cut_off, 60)
+        return (time_axis[0] * 60, *regular)
+
+    return _cache.get_or_compute(key, compute)
+
+
+def spectrogram_chunk(y, window, step, cut_off, interval) -> tuple:
+    """一批等间隔窗口的短时幅度谱：sliding_window_view 取窗口（视图，不复制），
+    一次批量 rfft。
+
+    Args:
+        window, step: 窗口长度、窗口间隔（点数）
+    Returns:
+        (频率, (窗口数, 频率数) float32 幅度)
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(y, window)[::step]
+    taper = signal.get_window("hann", window).astype(np.float32)
+    n_fft = sp_fft.next_fast_len(window, real=True)
+    freqs = sp_fft.rfftfreq(n_fft, interval)
+    keep = (freqs > 0) & (freqs < cut_off)
+    frames = windows - windows.mean(axis=1, keepdims=True)
+    frames *= taper
+    amplitude = np.abs(sp_fft.rfft(frames, n=n_fft, axis=1)[:, keep])
+    return freqs[keep], (amplitude * (2 / taper.sum())).astype(np.float32)
+
+
+def motor_spectrogram(
+    file_path,
+    column,
+    time_range=None,
+    window_seconds=60.0,
+    step_seconds=10.0,
+    cut_off=1.0,
+) -> tuple:
+    """电机数据某一列的频谱图（短时 FFT），用来查看直径振荡从什么时候开始。
+
+    信号先抽取到约 DECIMATE_MARGIN × cut_off 的采样率，窗口按块计算并缓存，
+    内存中最多同时有一块窗口的临时数组。
+
+    Args:
+        time_range: (起, 止)，单位与 time_axis 相同（分钟），默认全部
+        window_seconds: 每个窗口的长度（秒）
+        step_seconds: 相邻窗口的间隔（秒）
+    Returns:
+        (窗口中心时间 (min), 频率 (Hz), (窗口数, 频率数) 幅度)
+    """
+    t0, y, interval, kernel_width = _motor_signal(file_path, column, cut_off)
+    window = max(int(round(window_seconds / interval)), 2)
+    step = max(int(round(step_seconds / interval)), 1)
+    n_windows = (len(y) - window) // step + 1 if len(y) >= window else 0
+    first, last = 0, n_windows
+    if time_range is not None:
+        # 窗口完全落在时间范围内
+        first = int(np.ceil((time_range[0] * 60 - t0) / interval / step))
+        last = int(np.floor(((time_range[1] * 60 - t0) / interval - window) / step)) + 1
+        first, last = max(first, 0), min(last, n_windows)
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size, column, window, step, cut_off)
+    freqs = np.empty(0)
+    parts = []
+    for chunk in range(first // SPECTROGRAM_CHUNK, -(-last // SPECTROGRAM_CHUNK)):
+        start = chunk * SPECTROGRAM_CHUNK
+        stop = min(start + SPECTROGRAM_CHUNK, n_windows)
+        segment = y[start * step : (stop - 1) * step + window]
+        freqs, amplitude = _cache.get_or_compute(
+            ("spectrogram", *key, chunk),
+            lambda: spectrogram_chunk(segment, window, step, cut_off, interval),
+        )
+        parts.append(amplitude[max(first - start, 0) : last - start])
+    if not parts:
+        return np.empty(0), freqs, np.empty((0, 0), dtype=np.float32)
+    amplitude = np.concatenate(parts)
+    if kernel_width:
+        amplitude /= _box_response(freqs, kernel_width)
+    times = t0 + (np.arange(first, last) * step + window / 2) * interval
+    return times / 60, freqs, amplitude
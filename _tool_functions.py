@@ -1,17 +1,40 @@
 import datetime
 import os
-import struct
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+import zipfile
 
 import cv2
 import numpy as np
 import pandas as pd
 import streamlit as st
-import zstd
 from PIL import Image
 from scipy.signal import savgol_filter
 from scipy.optimize import curve_fit
 
+from _camera_bin import (
+    ZipMember,
+    estimate_fps,
+    select_frames,
+    sidecar_frame_count,
+    sort_by_start,
+    source_name,
+    stream_frames,
+    ts_per_second,
+)
+from _camera_export import (
+    PHOTO_FOLDER,
+    ImageExporter,
+    SegmentedVideoExport,
+    ffmpeg_available,
+    open_video_sink,
+)
+from _camera_stats import frame_stats
+from _data_store import SpectraData
+from _downsample import downsample
+from _frame_store import STORE_SUFFIX, FrameStoreWriter
+from _jobs import get_job_manager
+from _spectral import spectrum
+
 
 def bin_filename_to_datetime(filename):
     # convert filename to datetime
@@ -22,155 +45,162 @@ def bin_filename_to_datetime(filename):
     return dt
 
 
-def file_list_to_df(file_list) -> pd.DataFrame:
+def file_list_to_df(file_list, folder_path=None) -> pd.DataFrame:
     # make a dataframe that have filename and datetime columns
+    # 给出 folder_path 时，从已有的 sidecar 索引读取帧数（没有索引的文件留空）
     df_list = []
     for f in file_list:
         dt = bin_filename_to_datetime(f)
-        df_list.append({"filename": f, "datetime": dt})
-    df = pd.DataFrame(df_list, columns=["filename", "datetime"])
+        row = {"filename": f, "datetime": dt}
+        if folder_path is not None:
+            row["frames"] = sidecar_frame_count(os.path.join(folder_path, f))
+        df_list.append(row)
+    columns = ["filename", "datetime"]
+    if folder_path is not None:
+        columns.append("frames")
+    df = pd.DataFrame(df_list, columns=columns)
     return df
 
 
-def _read_frames(file_bytes) -> list:
-    frames = []
-    while True:
-        try:
-            frame_len_bytes = file_bytes.read(4)
-            if len(frame_len_bytes) < 4:
-                break
-            frame_len = int.from_bytes(frame_len_bytes, "little")
-            if frame_len == 0:
-                break
-            frame_bytes = file_bytes.read(frame_len)
-            if len(frame_bytes) < frame_len:
-                break
-            frames.append(frame_len_bytes + frame_bytes)
-        except ValueError as e:
-            print(f"读取文件 {file_bytes.name} 出错：{e}")
-            break
-    return frames
-
-
-def _process_frame(frame_bytes: bytearray) -> tuple | None:
-    len_size = 4
-    frame_bytes = frame_bytes[len_size:]
-    try:
-        frame_bytes = zstd.decompress(frame_bytes)
-    except zstd.ZstdError as e:
-        st.error(f"解压文件出错：{e}")
-
-    if len(frame_bytes) <= 0:
-        return None
-
-    try:
-        data_offset = 24
-        frame_header = struct.unpack("I4H2If", frame_bytes[:data_offset])
-        frame_length = frame_header[0]
-        height, width, channels = frame_header[2], frame_header[3], frame_header[4]
-        ts = (frame_header[5] << 32) + frame_header[6]
-        if channels == 1:
-            data = np.ndarray(
-                (height, width),
-                "B",
-                frame_bytes[:frame_length],
-                data_offset,
-                (width, 1),
-            )
-        else:  # untested
-            data = np.ndarray(
-                (height, width, channels),
-                "B",
-                frame_bytes[:frame_length],
-                data_offset,
-                (height * width, width, 1),
-            )
-        return ts, data
-    except Exception as e:
-        print(f"解析文件出错：{e}")
-        return None
-
-
-def _read_bin_file(file_path) -> list[np.ndarray]:
-    frame_ts_and_ndarrays = []
-    with open(file_path, "rb") as file:
-        header_size = 32
-        file.seek(header_size)
-        frames = _read_frames(file)
-
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(_process_frame, frame_bytes) for frame_bytes in frames
-        ]
-        for future in as_completed(futures):
-            frame_ndarray = future.result()
-            if frame_ndarray is not None:
-                frame_ts_and_ndarrays.append(frame_ndarray)
-    return frame_ts_and_ndarrays
-
-
-def _save_image(ts, data, file_path):
-    image_name = f"{ts}.jpg"
-    image_path = os.path.join(file_path, image_name)
-    if os.path.exists(image_path):
-        st.write(f"文件 {image_path} 已存在，跳过")
-        return
-    else:
-        image = Image.fromarray(data)
-        image.save(image_path)
+def _bin_file_paths(file_list, file_folder_path) -> list:
+    """file_folder_path 可以是文件夹，也可以是相机数据的 .zip 压缩包（直接读取，不解压）"""
+    if os.path.isfile(file_folder_path) and zipfile.is_zipfile(file_folder_path):
+        return [ZipMember(file_folder_path, f) for f in file_list]
+    return [os.path.join(file_folder_path, f) for f in file_list]
+
+
+def export_images_job(
+    file_paths,
+    photo_folder,
+    selection=None,
+    image_format="jpg",
+    quality=95,
+    encoder="cv2",
+    progress=None,
+) -> str:
+    """后台任务：把 .bin 文件（或其中选中的帧）导出为图片，返回结果说明"""
+    indices = select_frames(file_paths, **(selection or {}))
+    exporter = ImageExporter(photo_folder, image_format, quality, encoder)
+    stats = exporter.export(file_paths, indices, progress=progress)
+    return (
+        f"保存 {stats['saved']} 帧，跳过已存在的 {stats['skipped']} 帧，"
+        f"用时 {stats['seconds']:.1f} 秒（{stats['fps']:.1f} 帧/秒），"
+        f"保存在 {photo_folder}"
+    )
+
 
+def convert_to_images(
+    file_list,
+    folder_path,
+    selection=None,
+    image_format="jpg",
+    quality=95,
+    encoder="cv2",
+):
+    """把 .bin 文件转为图片（在后台任务中进行，见 show_jobs）。
 
-def convert_to_images(file_list, folder_path):
+    Args:
+        selection: select_frames 的参数（只导出选中的帧）
+        image_format: "jpg"、"png"、"webp"（无损）或 "npy"（整段帧数组）
+        quality: 0-100，jpg 为压缩质量，png 越高压缩越快
+        encoder: "cv2" 或 "pil"
+    Returns:
+        Job
+    """
     if not file_list:
         st.warning("没有选择文件，请先选择文件。")
         return
 
     # 在folder_path文件夹中创建photo文件夹
-    photo_folder = os.path.join(folder_path, "photo")
-    os.makedirs(photo_folder, exist_ok=True)
-
-    process_bar = st.progress(0, text="正在处理第 0 个文件")
-    for i, file_name in enumerate(file_list):
-        process_bar.progress((i + 1) / len(file_list), text=f"正在处理第 {i+1} 个文件")
-        frame_ts_and_ndarrays = _read_bin_file(os.path.join(folder_path, file_name))
-
-        with ThreadPoolExecutor() as executor:
-            for ts, data in frame_ts_and_ndarrays:
-                executor.submit(_save_image, ts, data, photo_folder)
-
-
-def _convert_bin_to_video(file_list, video_path, file_folder_path):
-    process_bar_placeholder = st.empty()
-    process_bar = process_bar_placeholder.progress(0, text="正在转换文件")
-    video_writer = None
+    photo_folder = os.path.join(folder_path, PHOTO_FOLDER)
+
+    file_paths = [os.path.join(folder_path, f) for f in file_list]
+    return get_job_manager().submit(
+        f"导出图片（{len(file_list)} 个文件）",
+        export_images_job,
+        file_paths,
+        photo_folder,
+        selection,
+        image_format,
+        quality,
+        encoder,
+    )
 
-    for i, file_name in enumerate(file_list):
-        process_bar.progress((i + 1) / len(file_list), text=f"正在转换第 {i+1} 个文件，共 {len(file_list)} 个文件")
-        frame_ts_and_ndarrays = _read_bin_file(os.path.join(file_folder_path, file_name))
 
-        # 初始化 video_writer 在第一次处理时设置视频宽高
-        if video_writer is None and frame_ts_and_ndarrays:
-            height, width = frame_ts_and_ndarrays[0][1].shape
-            video_writer = cv2.VideoWriter(
-                video_path, cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height)
+def export_video_job(
+    file_paths,
+    video_path,
+    selection=None,
+    fps=None,
+    backend="auto",
+    progress=None,
+    **video_options,
+) -> str:
+    """后台任务：把 .bin 文件（或其中选中的帧）编码为视频，返回结果说明"""
+    # 分段导出按文件顺序拼接，文件列表（os.listdir、压缩包顺序）先按首帧时间排序
+    file_paths = sort_by_start(file_paths)
+    # 只解码选中的帧，其余帧直接跳过
+    indices = select_frames(file_paths, **selection) if selection else None
+
+    if backend in ("auto", "ffmpeg") and ffmpeg_available(
+        video_options.get("ffmpeg", "ffmpeg")
+    ):
+        # 按文件分段编码，中断或新增文件后再次导出只编码缺少的片段
+        export = SegmentedVideoExport(
+            video_path,
+            {"fps": fps, "selection": selection, **video_options},
+        )
+        fps = fps or export.fps or estimate_fps(file_paths, indices) or 30
+        stats = export.run(
+            file_paths, fps, indices, "ffmpeg", progress=progress, **video_options
+        )
+        if stats["reused"] + stats["encoded"] == 0:
+            raise ValueError("没有找到有效的帧数据，请检查输入文件是否正确。")
+        return (
+            f"视频已保存到 {video_path}（复用已导出的 {stats['reused']} 个片段，"
+            f"新编码 {stats['encoded']} 个）"
+        )
+
+    # 默认按帧时间戳得到实际帧率，视频按真实速度播放
+    if not fps:
+        fps = estimate_fps(file_paths, indices) or 30
+    total = sum(len(i) for i in indices) if indices is not None else None
+    video_sink = None
+
+    # 解码在后台线程中进行，这里边取边编码，内存中只保留有界队列里的帧
+    for done, (_, ts, frame) in enumerate(
+        stream_frames(file_paths, merge=True, indices=indices), start=1
+    ):
+        # 初始化 video_sink 在第一次处理时设置视频宽高
+        if video_sink is None:
+            video_sink = open_video_sink(
+                video_path, fps, frame.shape, backend, **video_options
             )
 
-        # 按时间戳排序并逐帧写入视频
-        for ts, frame in sorted(frame_ts_and_ndarrays, key=lambda x: x[0]):
-            if len(frame.shape) == 2:  # 灰度图
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-            video_writer.write(frame)
-
-    if video_writer is None:
-        st.error("没有找到有效的帧数据，请检查输入文件是否正确。")
-        return
-
-    video_writer.release()
-    process_bar_placeholder.empty()
-
-
-def convert_to_video(file_list, output_folder_path, file_folder_path=None):
-    # 如果没有指定文件路径，则使用输出文件夹路径
+        # 帧按时间顺序到达，直接写入视频
+        video_sink.write(frame)
+        if progress is not None:
+            progress(done, total)
+
+    if video_sink is None:
+        raise ValueError("没有找到有效的帧数据，请检查输入文件是否正确。")
+    video_sink.close()
+    return f"视频已保存到 {video_path}"
+
+
+def convert_to_video(
+    file_list,
+    output_folder_path,
+    file_folder_path=None,
+    selection=None,
+    fps=None,
+    backend="auto",
+    **video_options,
+):
+    # 如果没有指定文件路径，则使用输出文件夹路径；也可以是相机数据的 .zip 压缩包
+    # selection 为 select_frames 的参数（时间窗口、帧范围、隔 N 帧），只导出选中的帧
+    # fps 默认由帧时间戳得到；backend/video_options 见 open_video_sink
+    # 编码在后台任务中进行，返回 Job
     if file_folder_path is None:
         file_folder_path = output_folder_path
     if not file_list:
@@ -179,43 +209,202 @@ def convert_to_video(file_list, output_folder_path, file_folder_path=None):
     video_folder = os.path.join(output_folder_path, "video")
     os.makedirs(video_folder, exist_ok=True)
 
-    base_name = os.path.splitext(os.path.basename(file_list[0]))[0]
+    # 按首帧时间排序后再定文件名：同样的文件不论以什么顺序选择，都得到同一个视频、
+    # 同一个分段目录（可以续传），后台任务也能识别为同一个
+    file_paths = sort_by_start(_bin_file_paths(file_list, file_folder_path))
+    base_name = os.path.splitext(source_name(file_paths[0]))[0]
     ts_str = base_name.split("-")[-1]
     ts = int(ts_str)
     formatted_time = datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d-%H点%M分")
+    if selection:
+        formatted_time += "-选段"
     video_path = os.path.join(video_folder, f"{formatted_time}.mp4")
 
-    _convert_bin_to_video(file_list, video_path, file_folder_path)
+    return get_job_manager().submit(
+        f"生成视频 {formatted_time}",
+        export_video_job,
+        file_paths,
+        video_path,
+        selection,
+        fps,
+        backend,
+        **video_options,
+    )
 
 
-def downsample_data(df: pd.DataFrame, max_points: int = 20000) -> pd.DataFrame:
-    """对数据进行下采样，确保数据点数量不超过 max_points"""
-    if len(df) > max_points:
-        df = df.iloc[:: len(df) // max_points]
-    return df
+def export_frame_store_job(
+    file_paths, store_path, selection=None, chunk_frames=64, progress=None
+) -> str:
+    """后台任务：把 .bin 文件（或其中选中的帧）写成帧数组目录，返回结果说明"""
+    indices = select_frames(file_paths, **(selection or {}))
+    total = sum(len(i) for i in indices)
+    if os.path.isdir(store_path):
+        shutil.rmtree(store_path)
+
+    writer = None
+    for done, (_, ts, frame) in enumerate(
+        stream_frames(file_paths, merge=True, indices=indices), start=1
+    ):
+        if writer is None:
+            writer = FrameStoreWriter(store_path, frame.shape, chunk_frames)
+        writer.append(ts, frame)
+        if progress is not None:
+            progress(done, total)
+
+    if writer is None:
+        raise ValueError("没有找到有效的帧数据，请检查输入文件是否正确。")
+    writer.close()
+    return f"帧数组已保存到 {store_path}"
+
+
+def convert_to_frame_store(file_list, folder_path, selection=None, chunk_frames=64):
+    """把 .bin 文件（或其中选中的帧）转为分块压缩的帧数组目录，供后续分析直接切片读取。
+
+    结果保存在 folder_path/frames/<首个文件名>.frames，用 FrameStore 打开。
+    转换在后台任务中进行，返回 Job。
+    """
+    if not file_list:
+        st.warning("没有选择文件，请先选择文件。")
+        return
 
+    # 与 convert_to_video 一样按首帧时间排序后再定目录名，选择顺序不同时也复用同一个目录
+    file_paths = sort_by_start([os.path.join(folder_path, f) for f in file_list])
+    stem = os.path.splitext(source_name(file_paths[0]))[0]
+    if selection:
+        stem += "-选段"
+    store_path = os.path.join(folder_path, "frames", stem + STORE_SUFFIX)
+    return get_job_manager().submit(
+        f"转为帧数组 {stem}",
+        export_frame_store_job,
+        file_paths,
+        store_path,
+        selection,
+        chunk_frames,
+    )
 
-def get_intensity_by_wavelength(df, wavelength, smooth=False, to_db=False):
-    """根据指定波长获取各条数据的强度值，支持平滑和dB转换"""
-    # 获取指定波长的索引
-    wavelength_index = np.argmin(np.abs(df["wavelengths"].iloc[0] - wavelength))
 
-    # 提取所有条目中该波长的强度
-    intensity = np.array(
-        [intensity_row[wavelength_index] for intensity_row in df["intensitys"]]
+def camera_stats_job(
+    file_paths, output_path, stats=("mean",), selection=None, progress=None, **params
+) -> str:
+    """后台任务：计算每帧统计量（见 frame_stats），保存为 .pkl，返回结果说明。
+
+    结果另有 time_min 列：相对第一帧的分钟数，与电机数据的 time_axis 对应。
+    """
+    df = frame_stats(file_paths, stats, selection, progress=progress, **params)
+    if len(df):
+        scale = ts_per_second(df.index[0], file_paths[0])
+        df["time_min"] = (df.index - df.index[0]) / scale / 60
+    df.to_pickle(output_path)
+    return f"{len(df)} 帧的统计量已保存到 {output_path}"
+
+
+def make_gif_job(
+    file_paths,
+    gif_path,
+    fps=25,
+    compression="无损",
+    start_time=0.0,
+    end_time=None,
+    speed_multiplier=1.0,
+    progress=None,
+) -> str:
+    """后台任务：把图片或视频（可裁剪时间范围、按倍速抽帧）制作成 GIF，返回结果说明"""
+    images = []
+    for i, file_path in enumerate(file_paths):
+        if file_path.lower().endswith((".mp4", ".avi")):
+            # 读取视频文件并提取帧
+            cap = cv2.VideoCapture(file_path)
+            video_fps = cap.get(cv2.CAP_PROP_FPS)
+            frame_start = int(start_time * video_fps)
+            frame_end = (
+                int(end_time * video_fps)
+                if end_time is not None
+                else int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            )
+            frame_step = max(int(speed_multiplier), 1)
+
+            current_frame = frame_start
+            while current_frame <= frame_end:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                images.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+                current_frame += frame_step
+            cap.release()
+        else:
+            # 读取图片文件
+            images.append(Image.open(file_path))
+        if progress is not None:
+            progress(i + 1, len(file_paths), "个文件")
+
+    if not images:
+        raise ValueError("未能生成 GIF，检查选择的文件是否有效。")
+    if compression != "无损":
+        # 将选择的压缩比转为整数，作为调色板颜色数
+        images = [
+            img.convert("P", palette=Image.ADAPTIVE, colors=int(compression))
+            for img in images
+        ]
+    duration = 1000 // fps  # 转换为毫秒
+    images[0].save(
+        gif_path, save_all=True, append_images=images[1:], duration=duration, loop=0
     )
+    return f"GIF 文件已生成: {gif_path}（{len(images)} 帧）"
+
+
+def make_pdf_job(file_paths, pdf_path, progress=None) -> str:
+    """后台任务：把图片按顺序合成一个 PDF，返回结果说明"""
+    images = []
+    for i, file_path in enumerate(file_paths):
+        image = Image.open(file_path)
+        images.append(image.convert("RGB"))  # 转换为 RGB
+        if progress is not None:
+            progress(i + 1, len(file_paths), "张图片")
+    if not images:
+        raise ValueError("未能生成 PDF，检查选择的文件是否有效。")
+    images[0].save(pdf_path, save_all=True, append_images=images[1:])
+    return f"PDF 文件已生成: {pdf_path}"
+
+
+def downsample_data(
+    df: pd.DataFrame, max_points: int = 20000, columns=None, method="m4"
+) -> pd.DataFrame:
+    """对数据进行下采样，确保数据点数量不超过 max_points。
+
+    默认用 M4（每段保留首尾和极值点），尖峰和直径缺陷不会被跳过；columns 为要画的列，
+    见 _downsample.downsample。
+    """
+    return downsample(df, max_points, method, columns)
+
+
+def get_intensity_by_wavelength(
+    df, wavelength, smooth=False, to_db=False, method="nearest", bandwidth=None
+):
+    """根据指定波长获取各条数据的强度值，支持平滑和dB转换。
+
+    Args:
+        df: SpectraData（见 load_spectra），也可以是旧格式的光谱 DataFrame
+        wavelength: 一个波长，或多个波长（返回 (行数, 波长数) 数组）
+        method, bandwidth: 见 SpectraData.extract（插值、波段积分）
+    """
+    if not isinstance(df, SpectraData):
+        df = SpectraData.from_frame(df)
+    # 所有波长一次从强度矩阵中取出
+    intensity = df.extract(wavelength, method, bandwidth)
 
     # 平滑处理
     if smooth:
         window_size = max(3, len(intensity) // 50)  # 自适应窗口大小
-        intensity = savgol_filter(intensity, window_size, polyorder=2)
+        intensity = savgol_filter(intensity, window_size, polyorder=2, axis=0)
 
     # 转换为 dB
     if to_db:
         reference = intensity[0]  # 使用第一个强度值作为参考
         intensity = -10 * np.log10(intensity / reference)
 
-    return intensity
+    return intensity[:, 0] if np.ndim(wavelength) == 0 else intensity
+
 
 def linear_curve_fit(x, y):
     def fun(x, a, b):
@@ -224,28 +413,18 @@ def linear_curve_fit(x, y):
     (a, b), _ = curve_fit(fun, x, y)
     return a, b
 
-def auto_fft(time_axis, y_axis, cut_off, downsample_length=30000) -> pd.DataFrame:
+def auto_fft(
+    time_axis, y_axis, cut_off, downsample_length=30000, method="rfft"
+) -> pd.DataFrame:
     """自动fft。
     Args:
         time_axis: 时间轴（秒），可以是非均匀采样
         y_axis: 信号值
         cut_off: 截断频率（Hz）
         downsample_length: 下采样长度（点数）
+        method: "rfft" 或 "welch"（见 _spectral.spectrum）
     Returns:
         dataframe({"x_fft": xf, "y_fft": yf})
     """
-    uniformed_x = np.linspace(time_axis.min(), time_axis.max(), len(time_axis))
-    uniformed_y = np.interp(uniformed_x, time_axis, y_axis)
-    uniformed_y = uniformed_y - np.mean(uniformed_y)
-    N = len(uniformed_x)
-    sampling_interval = uniformed_x[1] - uniformed_x[0]
-    yf = np.fft.fft(uniformed_y)
-    xf = np.fft.fftfreq(N, sampling_interval)
-    positive_indices = xf > 0
-    xf = xf[positive_indices]
-    yf = np.abs(yf[positive_indices])
-    remove_high_freq = xf < cut_off
-    xf = xf[remove_high_freq]
-    yf = yf[remove_high_freq]
-
-    return downsample_data(pd.DataFrame({"x_fft": xf, "y_fft": yf}), downsample_length)
\ No newline at end of file
+    df_fft = spectrum(np.asarray(time_axis), np.asarray(y_axis), cut_off, method)
+    return downsample_data(df_fft, downsample_length, columns="y_fft")
@@ -0,0 +1,99 @@
+"""相机 .bin 解码速度对比。
+
+用法：
+    python bench_camera_decode.py [LHPG-xxxx.bin ...]
+
+不给文件时会在临时目录生成一个模拟录像。
+"""
+
+import argparse
+import os
+import struct
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import zstd
+
+from _camera_bin import FILE_HEADER_SIZE, CameraBinFile, parse_frame, zstandard
+
+
+def make_sample_file(file_path, n_frames=2000, height=480, width=640):
+    """生成与录制端格式一致的模拟 .bin 文件"""
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 40, (height, width), dtype=np.uint8)
+    with open(file_path, "wb") as f:
+        f.write(bytes(FILE_HEADER_SIZE))
+        for i in range(n_frames):
+            frame = background + np.uint8(i % 200)
+            ts = 1730122064_000000 + i * 33333
+            header = struct.pack(
+                "I4H2If", 24 + height * width, 0, height, width, 1,
+                ts >> 32, ts & 0xFFFFFFFF, 0.0,
+            )
+            compressed = zstd.compress(header + frame.tobytes(), 3)
+            f.write(len(compressed).to_bytes(4, "little") + compressed)
+
+
+def decode_per_frame_tasks(file_path) -> int:
+    """原来的做法：读出全部帧，每帧一个线程池任务调用 zstd.decompress"""
+    with open(file_path, "rb") as f:
+        f.seek(FILE_HEADER_SIZE)
+        frames = []
+        while True:
+            frame_len_bytes = f.read(4)
+            if len(frame_len_bytes) < 4:
+                break
+            frame_len = int.from_bytes(frame_len_bytes, "little")
+            if frame_len == 0:
+                break
+            frames.append(frame_len_bytes + f.read(frame_len))
+
+    def process(frame_bytes):
+        return parse_frame(zstd.decompress(frame_bytes[4:]))
+
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(process, frame_bytes) for frame_bytes in frames]
+        return sum(future.result() is not None for future in as_completed(futures))
+
+
+def decode_batch(file_path, backend="thread") -> int:
+    with CameraBinFile(file_path, use_sidecar=False) as bin_file:
+        timestamps, _ = bin_file.read_frames(backend=backend)
+    return int((timestamps >= 0).sum())
+
+
+def decode_batch_process(file_path) -> int:
+    return decode_batch(file_path, backend="process")
+
+
+def run(name, func, file_paths, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n_frames = sum(func(file_path) for file_path in file_paths)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<24}{n_frames:>8} 帧  {best:8.3f} s  {n_frames / best:10.1f} 帧/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="要测试的 .bin 文件")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_paths = args.files
+        if not file_paths:
+            file_paths = [os.path.join(temp_dir, "LHPG-1730122064.bin")]
+            make_sample_file(file_paths[0])
+
+        print(f"zstandard: {'已安装' if zstandard else '未安装，使用 zstd.decompress'}")
+        run("逐帧任务 (原做法)", decode_per_frame_tasks, file_paths, args.repeat)
+        run("批量解码 read_frames", decode_batch, file_paths, args.repeat)
+        run("批量解码 (进程池)", decode_batch_process, file_paths, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,15 @@ import streamlit as st
 from streamlit_extras.add_vertical_space import add_vertical_space
 from streamlit_extras.colored_header import colored_header
 
+from _jobs import show_jobs
+
 st.set_page_config(page_title="Diego 工具箱", layout="centered")
 
 all_in_one_page = st.Page("_lhpg_all_in_one.py", title="处理打包文件", icon="🧰")
 camera_page = st.Page("_lhpg_camera_data.py", title="相机数据处理", icon="📸")
 motor_page = st.Page("_lhpg_motor_data.py", title="电机数据处理", icon="⚙️")
 spectra_page = st.Page("_lhpg_spectra_data.py", title="光谱数据处理", icon="🌈")
+batch_page = st.Page("_lhpg_batch_analysis.py", title="批量分析", icon="📊")
 power_page = st.Page("_lhpg_power_data.py", title="功率数据处理", icon="🔋")
 gif_page = st.Page("_make_gif.py", title="制作GIF", icon="🎞️")
 pdf_page = st.Page("_make_pdf.py", title="制作PDF", icon="📃")
@@ -17,6 +20,7 @@ pg = st.navigation(
         camera_page,
         motor_page,
         spectra_page,
+        batch_page,
         power_page,
         gif_page,
         pdf_page,
@@ -29,6 +33,8 @@ with st.sidebar:
     add_vertical_space(1)
     st.image("diego studio logo.png")
     st.text("copyright © 2024 Diego")
+    # 所有页面共用的后台任务（转换视频、图片、GIF 等）
+    show_jobs(compact=True)
 
 colored_header(label="Diego 工具箱", description="请从侧边栏选择一个模块开始。")
 add_vertical_space(2)